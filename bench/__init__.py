@@ -0,0 +1 @@
+# Benchmark harness: a local Sonarr/Radarr/TMDB stand-in and a runner for the scripts.
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import random
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+GENRES = ["Action", "Adventure", "Animation", "Comedy", "Documentary", "Drama", "Family", "Reality",
+          "Science Fiction", "Thriller"]
+PROFILES = [{"id": 1, "name": "4k"}, {"id": 2, "name": "1080p"}, {"id": 3, "name": "720p"}]
+# The same tiers under the names of template_lidarr_config.json
+MUSIC_PROFILES = [{"id": 1, "name": "Lossless"}, {"id": 2, "name": "High Quality"}, {"id": 3, "name": "Standard"}]
+STATUSES = {"series": ["continuing", "ended", "upcoming"], "movie": ["released", "announced", "inCinemas"],
+            "artist": ["continuing", "ended"]}
+
+# Filler comparable to what real *arr payloads carry, so listing sizes are realistic.
+def _filler(rng: random.Random, title: str) -> Dict[str, Any]:
+    return {
+        "overview": " ".join(rng.choice(GENRES).lower() for _ in range(40)),
+        "images": [{"coverType": kind, "url": f"/MediaCover/{title}/{kind}.jpg", "remoteUrl": f"https://image.tmdb.org/{kind}.jpg"}
+                   for kind in ("poster", "fanart", "banner")],
+        "alternateTitles": [{"title": f"{title} {suffix}"} for suffix in ("AKA", "Intl")],
+        "path": f"/media/{title}",
+        "tags": [],
+    }
+
+def generate_series(count: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    series = []
+    for series_id in range(1, count + 1):
+        year = rng.randint(1970, 2025)
+        title = f"Series {series_id} ({year})" if rng.random() < 0.2 else f"Series {series_id}"
+        seasons = []
+        for season_number in range(1, rng.randint(1, 12) + 1):
+            episodes = rng.randint(6, 24)
+            files = rng.randint(0, episodes)
+            seasons.append({"seasonNumber": season_number, "monitored": True,
+                            "statistics": {"episodeCount": episodes, "episodeFileCount": files,
+                                           "sizeOnDisk": files * rng.randint(300, 6000) * 1024 ** 2}})
+        series.append({
+            "id": series_id, "title": title, "year": year, "status": rng.choice(STATUSES["series"]),
+            "tvdbId": 100000 + series_id, "imdbId": f"tt{2000000 + series_id}",
+            "tmdbId": series_id if rng.random() < 0.5 else 0,
+            "genres": rng.sample(GENRES, rng.randint(0, 3)),
+            "qualityProfileId": rng.choice(PROFILES)["id"],
+            "previousAiring": f"{rng.randint(year, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T20:00:00Z",
+            "seasons": seasons,
+            "statistics": {"episodeCount": sum(s["statistics"]["episodeCount"] for s in seasons),
+                           "episodeFileCount": sum(s["statistics"]["episodeFileCount"] for s in seasons),
+                           "sizeOnDisk": sum(s["statistics"]["sizeOnDisk"] for s in seasons)},
+            **_filler(rng, title),
+        })
+    return series
+
+def generate_movies(count: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed + 1)
+    movies = []
+    for movie_id in range(1, count + 1):
+        year = rng.randint(1950, 2025)
+        title = f"Movie {movie_id}"
+        has_file = rng.random() < 0.9
+        movies.append({
+            "id": movie_id, "title": title, "year": year, "status": rng.choice(STATUSES["movie"]),
+            "tmdbId": 500000 + movie_id if rng.random() < 0.98 else 0, "imdbId": f"tt{5000000 + movie_id}",
+            "genres": rng.sample(GENRES, rng.randint(0, 3)),
+            "qualityProfileId": rng.choice(PROFILES)["id"],
+            "inCinemas": f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00Z",
+            "hasFile": has_file, "sizeOnDisk": rng.randint(700, 60000) * 1024 ** 2 if has_file else 0,
+            **_filler(rng, title),
+        })
+    return movies
+
+def generate_artists(count: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed + 2)
+    artists = []
+    for artist_id in range(1, count + 1):
+        name = f"Artist {artist_id}"
+        tracks = rng.randint(5, 400)
+        files = rng.randint(0, tracks)
+        year = rng.randint(1960, 2025)
+        artists.append({
+            "id": artist_id, "artistName": name, "foreignArtistId": f"mbid-{artist_id}",
+            "status": rng.choice(STATUSES["artist"]),
+            "genres": rng.sample(GENRES, rng.randint(0, 3)),
+            "qualityProfileId": rng.choice(PROFILES)["id"],
+            "ratings": {"votes": rng.randint(0, 500), "value": round(rng.uniform(2, 9.5), 1)},
+            "statistics": {"albumCount": rng.randint(1, 30), "trackFileCount": files, "trackCount": tracks,
+                           "totalTrackCount": tracks, "sizeOnDisk": files * rng.randint(5, 60) * 1024 ** 2},
+            "lastAlbum": {"title": f"{name} Album", "releaseDate": f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00Z"},
+            **_filler(rng, name),
+        })
+    return artists
+
+# Local stand-in for the Sonarr v3, Radarr v3, Lidarr v1 and TMDB endpoints the scripts use,
+# with a synthetic library, artificial latency and injectable 429s and 5xx errors.
+class MockArr:
+    def __init__(self, size: int = 1000, seed: int = 1, latency_ms: float = 0, tmdb_latency_ms: float = 0,
+                 rate_429: float = 0, error_rate: float = 0, retry_after: float = 1):
+        self.series = {item["id"]: item for item in generate_series(size, seed)}
+        self.movies = {item["id"]: item for item in generate_movies(size, seed)}
+        self.artists = {item["id"]: item for item in generate_artists(size, seed)}
+        self.latency = latency_ms / 1000
+        self.tmdb_latency = tmdb_latency_ms / 1000
+        self.rate_429 = rate_429
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.requests = Counter()
+        self.faults = Counter()
+        self.app = self._build_app()
+        self._runner: Optional[web.AppRunner] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.add_routes([
+            web.get("/api/v3/qualityprofile", self.quality_profiles),
+            web.get("/api/v3/qualityProfile", self.quality_profiles),
+            web.get("/api/v3/series", self.list_series),
+            web.put("/api/v3/series/editor", self.edit_series),
+            web.get("/api/v3/series/{id}", self.get_series),
+            web.put("/api/v3/series/{id}", self.put_series),
+            web.get("/api/v3/movie", self.list_movies),
+            web.put("/api/v3/movie/editor", self.edit_movies),
+            web.get("/api/v3/movie/{id}", self.get_movie),
+            web.put("/api/v3/movie/{id}", self.put_movie),
+            web.get("/api/v1/qualityprofile", self.music_profiles),
+            web.get("/api/v1/artist", self.list_artists),
+            web.put("/api/v1/artist/editor", self.edit_artists),
+            web.get("/api/v1/artist/{id}", self.get_artist),
+            web.get("/3/search/{media_type}", self.tmdb_search),
+            web.get("/3/find/{external_id}", self.tmdb_find),
+            web.get("/3/{media_type}/{id}", self.tmdb_details),
+        ])
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        endpoint = f"{request.method} {resource.canonical if resource else request.path}"
+        self.requests[endpoint] += 1
+        tmdb = request.path.startswith("/3/")
+        delay = self.tmdb_latency if tmdb else self.latency
+        if delay:
+            await asyncio.sleep(delay)
+        if tmdb and self.rate_429 and self.rng.random() < self.rate_429:
+            self.faults["429"] += 1
+            return web.Response(status=429, headers={"Retry-After": str(self.retry_after)})
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.faults["503"] += 1
+            return web.Response(status=503)
+        return await handler(request)
+
+    async def quality_profiles(self, request):
+        return web.json_response(PROFILES)
+
+    async def music_profiles(self, request):
+        return web.json_response(MUSIC_PROFILES)
+
+    async def list_series(self, request):
+        return web.json_response(list(self.series.values()))
+
+    async def get_series(self, request):
+        return self._item(self.series, request)
+
+    async def put_series(self, request):
+        return await self._put(self.series, request)
+
+    async def edit_series(self, request):
+        return await self._edit(self.series, request, "seriesIds")
+
+    async def list_movies(self, request):
+        return web.json_response(list(self.movies.values()))
+
+    async def get_movie(self, request):
+        return self._item(self.movies, request)
+
+    async def put_movie(self, request):
+        return await self._put(self.movies, request)
+
+    async def edit_movies(self, request):
+        return await self._edit(self.movies, request, "movieIds")
+
+    async def list_artists(self, request):
+        return web.json_response(list(self.artists.values()))
+
+    async def get_artist(self, request):
+        return self._item(self.artists, request)
+
+    async def edit_artists(self, request):
+        return await self._edit(self.artists, request, "artistIds")
+
+    def _item(self, items, request):
+        item = items.get(int(request.match_info["id"]))
+        if item is None:
+            raise web.HTTPNotFound()
+        return web.json_response(item)
+
+    async def _put(self, items, request):
+        item_id = int(request.match_info["id"])
+        if item_id not in items:
+            raise web.HTTPNotFound()
+        items[item_id] = await request.json()
+        return web.json_response(items[item_id], status=202)
+
+    async def _edit(self, items, request, ids_field):
+        body = await request.json()
+        for item_id in body.get(ids_field, []):
+            if item_id in items and "qualityProfileId" in body:
+                items[item_id]["qualityProfileId"] = body["qualityProfileId"]
+        return web.json_response([], status=202)
+
+    async def tmdb_search(self, request):
+        query = request.query.get("query", "")
+        if query.endswith("7"):  # a few titles TMDB does not know
+            return web.json_response({"page": 1, "total_results": 0, "results": []})
+        return web.json_response({"page": 1, "total_results": 1, "results": [{"id": 900000 + len(query) * 1000 + sum(map(ord, query)) % 1000}]})
+
+    async def tmdb_find(self, request):
+        external_id = request.match_info["external_id"]
+        digits = int("".join(ch for ch in external_id if ch.isdigit()) or 0)
+        results = [{"id": 700000 + digits % 100000}] if digits % 50 else []
+        source = request.query.get("external_source")
+        return web.json_response({"tv_results": results if source == "tvdb_id" else [],
+                                  "movie_results": results if source == "imdb_id" else []})
+
+    async def tmdb_details(self, request):
+        tmdb_id = int(request.match_info["id"])
+        return web.json_response({"id": tmdb_id, "vote_average": round(random.Random(tmdb_id).uniform(2, 9.5), 1)})
+
+    # Serve on 127.0.0.1:port from a background thread; returns the base URL.
+    def start(self, port: int = 0) -> str:
+        started = threading.Event()
+        address = {}
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._runner = web.AppRunner(self.app, access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, "127.0.0.1", port)
+            self._loop.run_until_complete(site.start())
+            address["port"] = self._runner.addresses[0][1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return f"http://127.0.0.1:{address['port']}"
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic Sonarr/Radarr/Lidarr/TMDB API for benchmarking.")
+    parser.add_argument("--port", type=int, default=8989)
+    parser.add_argument("--size", type=int, default=1000, help="number of series, of movies and of artists")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0, help="added latency per Sonarr/Radarr/Lidarr request")
+    parser.add_argument("--tmdb-latency-ms", type=float, default=0, help="added latency per TMDB request")
+    parser.add_argument("--rate-429", type=float, default=0, help="fraction of TMDB requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    mock = MockArr(args.size, args.seed, args.latency_ms, args.tmdb_latency_ms, args.rate_429, args.error_rate)
+    print(f"Serving {args.size} series, movies and artists on http://127.0.0.1:{args.port} "
+          f"(Sonarr/Radarr at /api/v3, Lidarr at /api/v1, TMDB at /3)")
+    web.run_app(mock.app, host="127.0.0.1", port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from bench.mock_arr import MockArr
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPTS = {
+    "sonarr": ("downgraderr.py", "template_sonarr_config.json", "config.json", "SONARR_IP"),
+    "radarr": ("downgraderr_radarr.py", "template_radarr_config.json", "config_radarr.json", "RADARR_IP"),
+    "lidarr": ("downgraderr_lidarr.py", "template_lidarr_config.json", "config_lidarr.json", "LIDARR_IP"),
+}
+
+# (name, extra arguments, start from an empty cache)
+SCENARIOS = [
+    ("cold", [], True),
+    ("warm", [], False),
+    ("full", ["--full"], False),
+]
+
+CACHE_RE = re.compile(r"Rating cache: (\d+)/(\d+) hits")
+STARTUP_RE = re.compile(r"Startup: first request after (\d+) ms")
+
+# Write the script's config into `workdir`, pointed at the mock server.
+def write_config(workdir: str, script: str, base_url: str, tmdb_rate: float):
+    _, template, name, ip_key = SCRIPTS[script]
+    with open(os.path.join(REPO, template), "r") as f:
+        config = json.load(f)
+    config.update({ip_key: base_url, "API_KEY": "bench", "TMDB_API_KEY": "bench",
+                   "TMDB_API_URL": f"{base_url}/3", "CACHE_DIR": os.path.join(workdir, "cache")})
+    config.setdefault("RATE_LIMITS", {}).setdefault("tmdb", {})["RATE"] = tmdb_rate
+    with open(os.path.join(workdir, name), "w") as f:
+        json.dump(config, f, indent=2)
+
+# Run one script to completion and return wall time, exit code, peak RSS and its log.
+def run_script(workdir: str, script: str, args: List[str]) -> Dict[str, Any]:
+    log_path = os.path.join(workdir, f"{script}.log")
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(REPO, SCRIPTS[script][0]), *args],
+                                   cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    with open(log_path, "r") as log:
+        output = log.read()
+    return {"wall_s": round(wall, 3), "exit_code": process.returncode,
+            "peak_rss_mib": round(usage.ru_maxrss / 1024, 1), "log": output}
+
+def cache_hit_rate(output: str) -> Optional[float]:
+    match = CACHE_RE.search(output)
+    if not match or int(match.group(2)) == 0:
+        return None
+    return round(int(match.group(1)) / int(match.group(2)), 3)
+
+# Process start to first HTTP request, as logged by the script.
+def startup_ms(output: str) -> Optional[int]:
+    match = STARTUP_RE.search(output)
+    return int(match.group(1)) if match else None
+
+def run_benchmarks(args) -> List[Dict[str, Any]]:
+    mock = MockArr(args.size, args.seed, args.latency_ms, args.tmdb_latency_ms, args.rate_429, args.error_rate)
+    base_url = mock.start()
+    results = []
+    try:
+        for script in args.scripts:
+            with tempfile.TemporaryDirectory(prefix=f"downgraderr-bench-{script}-") as workdir:
+                write_config(workdir, script, base_url, args.tmdb_rate)
+                for scenario, extra_args, cold in SCENARIOS:
+                    if cold:
+                        subprocess.run(["rm", "-rf", os.path.join(workdir, "cache")], check=True)
+                    before = mock.requests.copy()
+                    faults_before = mock.faults.copy()
+                    result = run_script(workdir, script, extra_args)
+                    requests = mock.requests - before
+                    result.update({
+                        "script": script, "scenario": scenario, "size": args.size,
+                        "requests": sum(requests.values()), "requests_by_endpoint": dict(sorted(requests.items())),
+                        "faults_injected": dict(mock.faults - faults_before),
+                        "cache_hit_rate": cache_hit_rate(result["log"]),
+                        "startup_ms": startup_ms(result["log"]),
+                    })
+                    if result["exit_code"] != 0:
+                        print(f"{script}/{scenario} exited with {result['exit_code']}:\n{result['log'][-2000:]}", file=sys.stderr)
+                    del result["log"]
+                    results.append(result)
+    finally:
+        mock.stop()
+    return results
+
+def print_results(results: List[Dict[str, Any]]):
+    print(f"{'run':<14} {'wall s':>8} {'startup ms':>11} {'requests':>9} {'peak RSS MiB':>13} {'cache hits':>11}  faults")
+    for result in results:
+        hit_rate = "n/a" if result["cache_hit_rate"] is None else f"{result['cache_hit_rate']:.0%}"
+        faults = ", ".join(f"{code}: {count}" for code, count in result["faults_injected"].items()) or "-"
+        startup = "n/a" if result["startup_ms"] is None else result["startup_ms"]
+        print(f"{result['script'] + '/' + result['scenario']:<14} {result['wall_s']:>8.2f} {startup:>11} {result['requests']:>9} "
+              f"{result['peak_rss_mib']:>13.1f} {hit_rate:>11}  {faults}")
+        for endpoint, count in result["requests_by_endpoint"].items():
+            print(f"    {endpoint:<40} {count:>7}")
+
+# Compare against an earlier --json file; returns the regressions beyond `tolerance`.
+def find_regressions(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path, "r") as f:
+        baseline = {(r["script"], r["scenario"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["script"], result["scenario"]))
+        if not previous:
+            continue
+        for metric in ("wall_s", "startup_ms", "requests", "peak_rss_mib"):
+            if previous.get(metric) and result[metric] and result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{result['script']}/{result['scenario']} {metric}: "
+                                   f"{previous[metric]} -> {result[metric]}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Sonarr, Radarr and Lidarr scripts against a local mock server.")
+    parser.add_argument("--size", type=int, default=2000, help="number of series, of movies and of artists in the mock library")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=2, help="added latency per Sonarr/Radarr/Lidarr request")
+    parser.add_argument("--tmdb-latency-ms", type=float, default=20, help="added latency per TMDB request")
+    parser.add_argument("--rate-429", type=float, default=0.01, help="fraction of TMDB requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.002, help="fraction of requests answered with 503")
+    parser.add_argument("--tmdb-rate", type=float, default=0,
+                        help="TMDB requests per second the scripts may send (0: unlimited, so the run measures the scripts)")
+    parser.add_argument("--scripts", nargs="+", choices=sorted(SCRIPTS), default=sorted(SCRIPTS))
+    parser.add_argument("--json", metavar="FILE", help="write the results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="fail if results regress against this earlier --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression against the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    failed = [f"{r['script']}/{r['scenario']} exited with {r['exit_code']}" for r in results if r["exit_code"] != 0]
+    if args.baseline:
+        failed += find_regressions(results, args.baseline, args.tolerance)
+    for failure in failed:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
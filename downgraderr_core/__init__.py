@@ -0,0 +1 @@
+# Shared building blocks for the downgraderr scripts.
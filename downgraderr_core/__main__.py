@@ -0,0 +1,3 @@
+from downgraderr_core.cli import main
+
+main()
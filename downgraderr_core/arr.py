@@ -0,0 +1,69 @@
+import re
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from downgraderr_core.editor import DEFAULT_CHUNK_SIZE, BulkEditor
+from downgraderr_core.records import ItemRecord
+from downgraderr_core.snapshot import ItemSnapshot
+
+# API version and quality profile endpoint per app.
+APIS = {
+    "sonarr": ("v3", "qualityprofile"),
+    "radarr": ("v3", "qualityProfile"),
+    "lidarr": ("v1", "qualityprofile"),
+}
+
+# "http://host:8989" -> "http://host:8989/api/v3"
+def api_url(app: str, base_url: str) -> str:
+    return f"{base_url}/api/{APIS[app][0]}"
+
+# Remove the year from a title if present, and return the year.
+def strip_year_from_title(title: str) -> Tuple[str, Optional[int]]:
+    match = re.search(r"\((\d{4})\)$", title)
+    if match:
+        year = int(match.group(1))
+        title_cleaned = re.sub(r"\s*\(\d{4}\)$", "", title).strip()
+        return title_cleaned, year
+    return title, None
+
+# Get the profile ID for a given profile name.
+def get_profile_id(profile_name: str, profiles: List[Dict[str, Any]]) -> int:
+    for profile in profiles:
+        if profile['name'].lower() == profile_name.lower():
+            return profile['id']
+    raise ValueError(f"Profile name '{profile_name}' not found")
+
+# Client for one Sonarr, Radarr or Lidarr instance. Every request goes through the
+# scheduler (pooled session, per-host limits, retries and metrics); the library is
+# read with one streamed list call and profiles are written through the bulk editor.
+class ArrClient:
+    def __init__(self, app: str, scheduler, base_url: str, api_key: str):
+        self.profile_path = APIS[app][1]
+        self.app = app
+        self.scheduler = scheduler
+        self.api_url = api_url(app, base_url)
+        self.headers = {"X-Api-Key": api_key}
+
+    # GET with retries, rate limited per host. Also what the TMDB helpers are given
+    # to fetch with, so TMDB requests share the session and the scheduler.
+    async def fetch(self, session, url: str, params: Optional[Dict[str, Any]] = None,
+                    headers: Optional[Dict[str, str]] = None) -> Any:
+        return await self.scheduler.request(session, "GET", url, params=params, headers=headers)
+
+    # GET an API path ("series/12") of this instance.
+    async def get(self, session, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        return await self.fetch(session, f"{self.api_url}/{path}", params=params, headers=self.headers)
+
+    async def get_profiles(self, session) -> List[Dict[str, Any]]:
+        return await self.get(session, self.profile_path)
+
+    async def get_item(self, session, kind: str, item_id: int) -> Dict[str, Any]:
+        return await self.get(session, f"{kind}/{item_id}")
+
+    # Stream the whole /{kind} listing into `snapshot` as compact records.
+    def stream(self, session, snapshot: ItemSnapshot, kind: str,
+               to_record: Callable[[Dict[str, Any]], ItemRecord]) -> AsyncIterator[ItemRecord]:
+        return snapshot.stream(self.scheduler, session, f"{self.api_url}/{kind}", self.headers, to_record)
+
+    # Bulk editor for /{kind}/editor, `ids_field` being e.g. "seriesIds".
+    def editor(self, kind: str, ids_field: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> BulkEditor:
+        return BulkEditor(self.scheduler, f"{self.api_url}/{kind}/editor", ids_field, self.headers, chunk_size)
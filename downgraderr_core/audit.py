@@ -0,0 +1,249 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from downgraderr_core.cache import MetadataCache
+from downgraderr_core.editor import ProfileChange
+
+# An item moved off a profile is not moved back onto it within this many days
+# (FLAP_WINDOW_DAYS; 0 turns the check off). Every round trip is two re-downloads.
+DEFAULT_FLAP_WINDOW_DAYS = 30
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS profile_audit (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    app TEXT NOT NULL,
+    instance TEXT NOT NULL DEFAULT '',
+    item_id INTEGER NOT NULL,
+    title TEXT,
+    old_profile_id INTEGER,
+    new_profile_id INTEGER,
+    rule TEXT,
+    suppressed INTEGER NOT NULL DEFAULT 0,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS profile_audit_item ON profile_audit (item_id, timestamp);
+CREATE INDEX IF NOT EXISTS profile_audit_time ON profile_audit (timestamp);
+'''
+
+# "7d", "12h", "30m" -> timedelta.
+def parse_duration(text: str) -> timedelta:
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([dhm])\s*", text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid duration '{text}' (expected e.g. 7d, 12h or 30m)")
+    unit = {"d": "days", "h": "hours", "m": "minutes"}[match.group(2).lower()]
+    return timedelta(**{unit: float(match.group(1))})
+
+# Every profile change made (and every one suppressed as flapping), per run, in the
+# metadata cache database next to the ratings. Rows are buffered and handed to the
+# cache's database thread in batches, which commits them with its own writes.
+class AuditLog:
+    def __init__(self, cache: MetadataCache, app: str, instance: str = "",
+                 flap_window: timedelta = timedelta(days=DEFAULT_FLAP_WINDOW_DAYS)):
+        self.cache = cache
+        self.app = app
+        self.instance = instance
+        self.flap_window = flap_window
+        self.cache.db.executescript(SCHEMA)
+        self.rows: List[Tuple] = []
+        self.run_id: Optional[str] = None
+        # item id -> profiles it was moved off within the flap window
+        self.recent: Dict[int, Set[int]] = {}
+        self.recorded = 0
+        self.suppressed = 0
+        # Dry runs check for flapping but write nothing.
+        self.read_only = False
+
+    @classmethod
+    def from_config(cls, cache: MetadataCache, app: str, instance: str, config: Dict) -> "AuditLog":
+        return cls(cache, app, instance, timedelta(days=config.get("FLAP_WINDOW_DAYS", DEFAULT_FLAP_WINDOW_DAYS)))
+
+    # Start a run: a new run id, and one query for the moves still inside the flap window.
+    async def start_run(self, read_only: bool = False) -> str:
+        self.flush()
+        self.run_id = uuid.uuid4().hex[:12]
+        self.read_only = read_only
+        self.recorded = self.suppressed = 0
+        self.recent = defaultdict(set)
+        if self.flap_window:
+            since = (datetime.now() - self.flap_window).isoformat()
+            for item_id, old_profile_id in await self.cache.db.fetch(
+                    "SELECT item_id, old_profile_id FROM profile_audit "
+                    "WHERE timestamp >= ? AND app = ? AND instance = ? AND suppressed = 0",
+                    (since, self.app, self.instance)):
+                self.recent[item_id].add(old_profile_id)
+        return self.run_id
+
+    def _row(self, change: ProfileChange, suppressed: bool) -> Tuple:
+        return (self.run_id, self.app, self.instance, change.item_id, change.title, change.old_profile_id,
+                change.new_profile_id, change.rule, int(suppressed), datetime.now().isoformat())
+
+    # True (and the suppression logged) when `change` would move an item back onto a
+    # profile it was moved off within the flap window.
+    def flapping(self, change: ProfileChange) -> bool:
+        if change.old_profile_id == change.new_profile_id or change.new_profile_id not in self.recent.get(change.item_id, ()):
+            return False
+        self.suppressed += 1
+        logging.info(f"Not moving '{change.title}' (ID: {change.item_id}) back to profile ID {change.new_profile_id}: "
+                     f"it left that profile less than {self.flap_window.total_seconds() / 86400:g} days ago ({change.rule})")
+        if not self.read_only:
+            self.rows.append(self._row(change, True))
+        return True
+
+    # Record changes that were applied.
+    def record(self, changes: Iterable[ProfileChange]):
+        for change in changes:
+            self.recent.setdefault(change.item_id, set()).add(change.old_profile_id)
+            self.recorded += 1
+            if not self.read_only:
+                self.rows.append(self._row(change, False))
+        if len(self.rows) >= self.cache.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.cache.db.executemany("INSERT INTO profile_audit (run_id, app, instance, item_id, title, old_profile_id, "
+                                  "new_profile_id, rule, suppressed, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  self.rows)
+        self.rows = []
+
+    # One-shot import of the Sonarr script's old change log (ratings.db profile_changes).
+    def migrate_profile_changes(self, path: str = "ratings.db"):
+        key = "migrated:profile_changes"
+        if self.cache._migrated(key) or not os.path.exists(path):
+            return
+        legacy = sqlite3.connect(path)
+        try:
+            rows = legacy.execute("SELECT series_id, old_profile_id, new_profile_id, timestamp FROM profile_changes").fetchall()
+        except sqlite3.DatabaseError:
+            rows = []
+        finally:
+            legacy.close()
+        self.cache.db.executemany("INSERT INTO profile_audit (run_id, app, instance, item_id, old_profile_id, new_profile_id, timestamp) "
+                                  "VALUES ('legacy', 'sonarr', '', ?, ?, ?, ?)", rows)
+        self.cache._mark_migrated(key, len(rows))
+
+    def report(self):
+        logging.info(f"Audit: run {self.run_id}, {self.recorded} profile changes recorded, "
+                     f"{self.suppressed} suppressed as flapping")
+
+# WHERE clause and parameters for the optional app/instance filters.
+def _filters(app: Optional[str], instance: Optional[str], clauses: List[str], params: List) -> str:
+    if app:
+        clauses.append("app = ?")
+        params.append(app)
+    if instance is not None:
+        clauses.append("instance = ?")
+        params.append(instance)
+    return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+# Every recorded change of one item, newest first.
+def history(conn: sqlite3.Connection, item_id: int, app: Optional[str] = None, instance: Optional[str] = None,
+            limit: int = 50) -> List[Tuple]:
+    params = [item_id]
+    where = _filters(app, instance, ["item_id = ?"], params)
+    return conn.execute(f"SELECT timestamp, run_id, app, instance, title, old_profile_id, new_profile_id, rule, suppressed "
+                        f"FROM profile_audit {where} ORDER BY timestamp DESC LIMIT ?", params + [limit]).fetchall()
+
+# Totals since a point in time: changes, suppressions, runs, the most common moves
+# and rules, and the items that moved most often.
+def stats(conn: sqlite3.Connection, since: datetime, app: Optional[str] = None, instance: Optional[str] = None,
+          top: int = 10) -> Dict:
+    params = [since.isoformat()]
+    where = _filters(app, instance, ["timestamp >= ?"], params)
+    changes, suppressed, items, runs = conn.execute(
+        f"SELECT SUM(suppressed = 0), SUM(suppressed), COUNT(DISTINCT item_id), COUNT(DISTINCT run_id) "
+        f"FROM profile_audit {where}", params).fetchone()
+    moves = conn.execute(f"SELECT old_profile_id, new_profile_id, COUNT(*) AS n FROM profile_audit {where} AND suppressed = 0 "
+                         f"GROUP BY old_profile_id, new_profile_id ORDER BY n DESC LIMIT ?", params + [top]).fetchall()
+    rules = conn.execute(f"SELECT rule, COUNT(*) AS n FROM profile_audit {where} AND suppressed = 0 "
+                         f"GROUP BY rule ORDER BY n DESC LIMIT ?", params + [top]).fetchall()
+    busiest = conn.execute(f"SELECT app, instance, item_id, MAX(title), SUM(suppressed = 0) AS n, SUM(suppressed) "
+                           f"FROM profile_audit {where} GROUP BY app, instance, item_id HAVING n > 1 OR SUM(suppressed) > 0 "
+                           f"ORDER BY n DESC, SUM(suppressed) DESC LIMIT ?", params + [top]).fetchall()
+    return {"since": since.isoformat(timespec="seconds"), "changes": changes or 0, "suppressed": suppressed or 0,
+            "items": items, "runs": runs,
+            "moves": [{"from": old, "to": new, "count": n} for old, new, n in moves],
+            "rules": [{"rule": rule, "count": n} for rule, n in rules],
+            "busiest_items": [{"app": row[0], "instance": row[1], "item_id": row[2], "title": row[3],
+                               "changes": row[4], "suppressed": row[5]} for row in busiest]}
+
+def _print_history(rows: List[Tuple]):
+    for timestamp, run_id, app, instance, title, old, new, rule, suppressed in rows:
+        where = f"{app}:{instance}" if instance else app
+        action = "suppressed" if suppressed else "moved"
+        print(f"{timestamp[:19]}  {run_id:<12}  {where:<16}  {action:<10}  {old} -> {new}  {title or ''}  ({rule or 'unknown rule'})")
+
+def _print_stats(result: Dict):
+    print(f"Since {result['since']}: {result['changes']} profile changes to {result['items']} items "
+          f"in {result['runs']} runs, {result['suppressed']} suppressed as flapping")
+    if result["moves"]:
+        print("Moves:")
+        for move in result["moves"]:
+            print(f"  {move['from']} -> {move['to']}: {move['count']}")
+    if result["rules"]:
+        print("Rules:")
+        for rule in result["rules"]:
+            print(f"  {rule['count']:>6}  {rule['rule'] or 'unknown rule'}")
+    if result["busiest_items"]:
+        print("Items changed more than once:")
+        for item in result["busiest_items"]:
+            where = f"{item['app']}:{item['instance']}" if item['instance'] else item['app']
+            print(f"  {where} {item['item_id']} {item['title'] or ''}: {item['changes']} changes, {item['suppressed']} suppressed")
+
+# Command line entry point: `python -m downgraderr_core audit history|stats`.
+def run(argv: Optional[List[str]] = None, prog: Optional[str] = None):
+    parser = argparse.ArgumentParser(prog=prog, description="Query the profile change audit log.")
+    parser.add_argument('--config', metavar='FILE', default='config.json', help="Sonarr or Radarr config file, for CACHE_DIR (default: config.json)")
+    # Filters and output format, accepted by both subcommands
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--app', choices=('sonarr', 'radarr', 'lidarr'), help="only changes made by this script")
+    common.add_argument('--instance', metavar='NAME', help="only changes made for this instance of a multi-instance run")
+    common.add_argument('--json', action='store_true', help="print JSON instead of text")
+    commands = parser.add_subparsers(dest='command', required=True)
+    history_parser = commands.add_parser('history', parents=[common], help="changes of one item, newest first")
+    history_parser.add_argument('--item', metavar='ID', type=int, required=True, help="series or movie id")
+    history_parser.add_argument('--limit', type=int, default=50, help="at most this many rows (default: 50)")
+    stats_parser = commands.add_parser('stats', parents=[common], help="totals, most common moves and rules, most changed items")
+    stats_parser.add_argument('--since', metavar='AGE|DATE', default='7d', help="e.g. 7d, 12h or 2024-01-31 (default: 7d)")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r') as file:
+        config = json.load(file)
+    path = os.path.join(config.get('CACHE_DIR') or ".", "metadata.db")
+    if not os.path.exists(path):
+        parser.error(f"no cache database at {path}")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    try:
+        if args.command == 'history':
+            rows = history(conn, args.item, args.app, args.instance, args.limit)
+            if args.json:
+                keys = ("timestamp", "run_id", "app", "instance", "title", "old_profile_id", "new_profile_id", "rule", "suppressed")
+                print(json.dumps([dict(zip(keys, row)) for row in rows], indent=2))
+            else:
+                _print_history(rows)
+        else:
+            try:
+                since = datetime.now() - parse_duration(args.since)
+            except ValueError:
+                try:
+                    since = datetime.fromisoformat(args.since)
+                except ValueError:
+                    parser.error(f"invalid --since '{args.since}' (expected e.g. 7d, 12h or 2024-01-31)")
+            result = stats(conn, since, args.app, args.instance)
+            if args.json:
+                print(json.dumps(result, indent=2))
+            else:
+                _print_stats(result)
+    finally:
+        conn.close()
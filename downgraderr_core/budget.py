@@ -0,0 +1,102 @@
+import bisect
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from downgraderr_core.editor import ProfileChange
+
+# Binary units, as the *arr UIs use them (their "GB" is 1024 ** 3 bytes).
+UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4, "P": 1024 ** 5}
+
+# Relative bytes per item at each cutoff resolution; only the ratios between
+# them matter. Used when PROFILE_SIZE_RATIOS does not name a profile.
+RESOLUTION_RATIOS = {2160: 1.0, 1080: 0.3, 720: 0.12, 576: 0.08, 480: 0.06}
+DEFAULT_SIZE_RATIOS = {"4k": 1.0, "1080p": 0.3, "720p": 0.12}
+
+# "4TB", "500 GB", "1.5T", "2 TiB" -> bytes.
+def parse_size(text: str) -> int:
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGTP]?)(?:i?B)?\s*", text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size '{text}' (expected e.g. 4TB or 500GB)")
+    return int(float(match.group(1)) * UNITS[match.group(2).upper()])
+
+def format_size(size: float) -> str:
+    for unit in ("TB", "GB", "MB"):
+        if size >= UNITS[unit[0]]:
+            return f"{size / UNITS[unit[0]]:.1f} {unit}"
+    return f"{size:.0f} B"
+
+# Highest resolution allowed at a quality profile's cutoff (a single quality or a group).
+def cutoff_resolution(profile: Dict[str, Any]) -> Optional[int]:
+    cutoff = profile.get("cutoff")
+    for item in profile.get("items", []):
+        quality = item.get("quality")
+        if quality and quality.get("id") == cutoff:
+            return quality.get("resolution")
+        if item.get("id") == cutoff and item.get("items"):
+            return max((sub["quality"].get("resolution") or 0 for sub in item["items"] if sub.get("quality")), default=None)
+    return None
+
+# Relative size per profile id: PROFILE_SIZE_RATIOS by profile name (4k/1080p/720p)
+# if configured, else from the profile's cutoff resolution, else the defaults.
+def size_ratios(profiles: List[Dict[str, Any]], profile_ids: Dict[str, int], configured: Dict[str, float]) -> Dict[int, float]:
+    by_id = {profile["id"]: profile for profile in profiles}
+    ratios = {}
+    for name, profile_id in profile_ids.items():
+        resolution = cutoff_resolution(by_id.get(profile_id, {}))
+        ratios[profile_id] = configured.get(name) or RESOLUTION_RATIOS.get(resolution) or DEFAULT_SIZE_RATIOS[name]
+    return ratios
+
+class Downgrade:
+    __slots__ = ('change', 'size', 'reclaimed')
+
+    def __init__(self, change: ProfileChange, size: int, reclaimed: int):
+        self.change = change
+        self.size = size
+        self.reclaimed = reclaimed
+
+# Bytes freed by re-downloading an item of `size` bytes at a profile of `new_ratio`.
+def estimate_reclaimed(size: int, old_ratio: Optional[float], new_ratio: Optional[float]) -> int:
+    if not size or not old_ratio or new_ratio is None or new_ratio >= old_ratio:
+        return 0
+    return int(size * (1 - new_ratio / old_ratio))
+
+# Pick the fewest rule-driven downgrades that free `target` bytes: candidates sorted
+# by estimated savings, largest first, taken until the target is met (no smaller set
+# can reach it). The last pick is then swapped for the smallest remaining candidate
+# that still meets the target, so the plan overshoots as little as possible.
+# Returns the ranked selection and the estimated total over all candidates.
+def plan_budget(changes: List[ProfileChange], sizes: Dict[int, int], ratios: Dict[int, float],
+                target: int) -> Tuple[List[Downgrade], int]:
+    candidates = []
+    for change in changes:
+        size = sizes.get(change.item_id, 0)
+        reclaimed = estimate_reclaimed(size, ratios.get(change.old_profile_id), ratios.get(change.new_profile_id))
+        if reclaimed > 0:
+            candidates.append(Downgrade(change, size, reclaimed))
+    candidates.sort(key=lambda downgrade: downgrade.reclaimed, reverse=True)
+    available = sum(downgrade.reclaimed for downgrade in candidates)
+
+    total = 0
+    count = 0
+    while count < len(candidates) and total < target:
+        total += candidates[count].reclaimed
+        count += 1
+    if count and total >= target:
+        # Candidates are sorted descending; find the last one still covering what the final pick must.
+        needed = target - (total - candidates[count - 1].reclaimed)
+        savings = [-downgrade.reclaimed for downgrade in candidates]
+        last = bisect.bisect_right(savings, -needed, lo=count - 1) - 1
+        candidates[count - 1], candidates[last] = candidates[last], candidates[count - 1]
+    selected = candidates[:count]
+    selected.sort(key=lambda downgrade: downgrade.reclaimed, reverse=True)
+    return selected, available
+
+def report_budget(selected: List[Downgrade], available: int, target: int):
+    reclaimed = sum(downgrade.reclaimed for downgrade in selected)
+    message = (f"Space budget: {len(selected)} downgrades free about {format_size(reclaimed)} "
+               f"of the {format_size(target)} requested ({format_size(available)} possible under the current rules)")
+    if reclaimed < target:
+        logging.warning(message)
+    else:
+        logging.info(message)
@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from downgraderr_core.database import DEFAULT_BATCH_SIZE, DEFAULT_COMMIT_INTERVAL, Database
+from downgraderr_core.metrics import Metrics
+
+# Ratings older than this are refetched from TMDB (RATING_TTL_DAYS).
+RATING_MAX_AGE = timedelta(days=7)
+
+# tmdb_id 0 records a lookup that found nothing. It is trusted for this long
+# (NOT_FOUND_TTL_HOURS), then the title is looked up again: it may have been added
+# to TMDB since, or renamed to match.
+NOT_FOUND = 0
+NOT_FOUND_MAX_AGE = timedelta(days=1)
+
+# Each rating's TTL is stretched or shrunk by up to this fraction (RATING_TTL_JITTER),
+# so ratings fetched in the same run do not all expire in the same later run.
+RATING_TTL_JITTER = 0.2
+
+# Entries kept in memory in front of SQLite, and for how many seconds. The TTL
+# bounds how long a long-running process can miss another process's writes.
+DEFAULT_MEMORY_SIZE = 50000
+DEFAULT_MEMORY_TTL = 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ratings
+    (media_type TEXT NOT NULL, tmdb_id INTEGER NOT NULL, rating REAL, timestamp TEXT,
+     PRIMARY KEY (media_type, tmdb_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tmdb_ids
+    (media_type TEXT NOT NULL, source TEXT NOT NULL, external_id TEXT NOT NULL, tmdb_id INTEGER, timestamp TEXT,
+     PRIMARY KEY (media_type, source, external_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta
+    (key TEXT PRIMARY KEY, value TEXT);
+'''
+
+# Least recently used entries are evicted once `max_size` is reached, and any
+# entry older than `ttl` seconds is treated as absent.
+class MemoryCache:
+    def __init__(self, max_size: int = DEFAULT_MEMORY_SIZE, ttl: float = DEFAULT_MEMORY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    # `ttl` shortens this entry's lifetime; it never extends it past the cache's.
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl)))
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+# TMDB metadata cache shared by the Sonarr and Radarr scripts ("tv" and "movie"
+# media types). One SQLite file in CACHE_DIR, WAL mode, accessed only through a
+# Database thread: writes are group-committed off the event loop and reads are
+# awaited. The state store and audit log share the same database.
+class MetadataCache:
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE, memory_size: int = DEFAULT_MEMORY_SIZE,
+                 memory_ttl: float = DEFAULT_MEMORY_TTL, rating_ttl: timedelta = RATING_MAX_AGE,
+                 rating_jitter: float = RATING_TTL_JITTER, commit_interval: float = DEFAULT_COMMIT_INTERVAL,
+                 not_found_ttl: timedelta = NOT_FOUND_MAX_AGE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.stats = Counter()
+        # SQLite read, write and commit latency ("read", "write", "commit")
+        self.metrics = Metrics()
+        self.db = Database(path, batch_size, commit_interval, self.metrics)
+        self.db.executescript(SCHEMA)
+        # (media_type, tmdb_id) -> (rating, fetched at); (media_type, source, external_id) -> tmdb_id
+        self.memory = MemoryCache(memory_size, memory_ttl)
+        self.rating_ttl = rating_ttl
+        self.rating_jitter = min(max(rating_jitter, 0.0), 1.0)
+        self.not_found_ttl = not_found_ttl
+
+    @classmethod
+    def open(cls, cache_dir: Optional[str], memory_size: int = DEFAULT_MEMORY_SIZE,
+             memory_ttl: float = DEFAULT_MEMORY_TTL, **kwargs) -> "MetadataCache":
+        return cls(os.path.join(cache_dir or ".", "metadata.db"), memory_size=memory_size, memory_ttl=memory_ttl, **kwargs)
+
+    # Cache settings from a script config.
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "MetadataCache":
+        return cls.open(config.get("CACHE_DIR"), config.get("MEMORY_CACHE_SIZE", DEFAULT_MEMORY_SIZE),
+                        config.get("MEMORY_CACHE_TTL", DEFAULT_MEMORY_TTL),
+                        rating_ttl=timedelta(days=config.get("RATING_TTL_DAYS", RATING_MAX_AGE.days)),
+                        rating_jitter=config.get("RATING_TTL_JITTER", RATING_TTL_JITTER),
+                        commit_interval=config.get("CACHE_COMMIT_INTERVAL", DEFAULT_COMMIT_INTERVAL),
+                        not_found_ttl=timedelta(hours=config.get("NOT_FOUND_TTL_HOURS", NOT_FOUND_MAX_AGE.total_seconds() / 3600)))
+
+    # Commit pending writes now instead of with their group; does not wait.
+    def commit(self):
+        self.db.commit()
+
+    # Commits what is pending and stops the database thread.
+    def close(self):
+        self.db.close()
+
+    # (rating, fetched at) from memory, else from SQLite; None if never rated.
+    async def _rating_row(self, media_type: str, tmdb_id: int) -> Optional[Tuple[float, datetime]]:
+        row = self.memory.get((media_type, tmdb_id))
+        if row is not None:
+            self.stats["memory_hit"] += 1
+            return row
+        stored = await self.db.fetch("SELECT rating, timestamp FROM ratings WHERE media_type = ? AND tmdb_id = ?",
+                                     (media_type, tmdb_id), one=True)
+        if stored is None:
+            # A fetch that finished while this read waited is in memory already
+            return self.memory.get((media_type, tmdb_id))
+        row = (stored[0], datetime.fromisoformat(stored[1]))
+        self.memory.put((media_type, tmdb_id), row)
+        return row
+
+    # When a rating fetched at `fetched_at` expires. The jitter is derived from the
+    # id, so an entry's expiry is the same in every run and every process.
+    def rating_expires(self, media_type: str, tmdb_id: int, fetched_at: datetime) -> datetime:
+        digest = hashlib.blake2b(f"{media_type}:{tmdb_id}".encode(), digest_size=8).digest()
+        spread = int.from_bytes(digest, "big") / 2 ** 64 * 2 - 1
+        return fetched_at + self.rating_ttl * (1 + self.rating_jitter * spread)
+
+    async def get_rating(self, media_type: str, tmdb_id: int) -> Optional[float]:
+        row = await self._rating_row(media_type, tmdb_id)
+        if row and datetime.now() < self.rating_expires(media_type, tmdb_id, row[1]):
+            self.stats["rating_hit"] += 1
+            return row[0]
+        self.stats["rating_miss"] += 1
+        return None
+
+    # True when there is a rating and it has expired.
+    async def rating_is_stale(self, media_type: str, tmdb_id: int) -> bool:
+        row = await self._rating_row(media_type, tmdb_id)
+        return row is not None and datetime.now() >= self.rating_expires(media_type, tmdb_id, row[1])
+
+    # Ratings that have expired or expire within `within`, soonest first. The scan
+    # runs on the database thread.
+    async def expiring_ratings(self, within: timedelta) -> List[Tuple[str, int, datetime]]:
+        horizon = datetime.now() + within
+
+        def scan(conn: sqlite3.Connection) -> List[Tuple[str, int, datetime]]:
+            expiring = []
+            for media_type, tmdb_id, timestamp in conn.execute("SELECT media_type, tmdb_id, timestamp FROM ratings"):
+                expires = self.rating_expires(media_type, tmdb_id, datetime.fromisoformat(timestamp))
+                if expires <= horizon:
+                    expiring.append((media_type, tmdb_id, expires))
+            expiring.sort(key=lambda entry: entry[2])
+            return expiring
+        return await asyncio.wrap_future(self.db.submit(scan))
+
+    # Cached rating regardless of age, without touching the hit/miss stats.
+    async def peek_rating(self, media_type: str, tmdb_id: int) -> Optional[float]:
+        row = await self._rating_row(media_type, tmdb_id)
+        return row[0] if row else None
+
+    # The memory entry is set before the write is queued, so every later read sees it.
+    def put_rating(self, media_type: str, tmdb_id: int, rating: float, timestamp: Optional[str] = None):
+        timestamp = timestamp or datetime.now().isoformat()
+        self.memory.put((media_type, tmdb_id), (rating, datetime.fromisoformat(timestamp)))
+        self.db.execute("INSERT OR REPLACE INTO ratings (media_type, tmdb_id, rating, timestamp) VALUES (?, ?, ?, ?)",
+                        (media_type, tmdb_id, rating, timestamp))
+
+    # Seconds a NOT_FOUND mapping stored at `timestamp` has left; 0 once expired.
+    def _not_found_left(self, timestamp: Optional[str]) -> float:
+        if not timestamp:
+            return 0
+        return max((datetime.fromisoformat(timestamp) + self.not_found_ttl - datetime.now()).total_seconds(), 0)
+
+    # An expired NOT_FOUND mapping counts as absent, so the item is looked up again.
+    async def get_tmdb_id(self, media_type: str, keys: List[Tuple[str, str]]) -> Optional[int]:
+        for source, external_id in keys:
+            key = (media_type, source, external_id)
+            tmdb_id = self.memory.get(key)
+            if tmdb_id is not None:
+                self.stats["memory_hit"] += 1
+                return tmdb_id
+            row = await self.db.fetch("SELECT tmdb_id, timestamp FROM tmdb_ids WHERE media_type = ? AND source = ? AND external_id = ?",
+                                      key, one=True)
+            if row is None:
+                # A lookup that finished while this read waited is in memory already
+                tmdb_id = self.memory.get(key)
+                if tmdb_id is not None:
+                    return tmdb_id
+                continue
+            tmdb_id, timestamp = row
+            if tmdb_id == NOT_FOUND:
+                left = self._not_found_left(timestamp)
+                if not left:
+                    continue
+                self.memory.put(key, tmdb_id, left)
+            else:
+                self.memory.put(key, tmdb_id)
+            return tmdb_id
+        return None
+
+    def put_tmdb_id(self, media_type: str, source: str, external_id: str, tmdb_id: int):
+        self.memory.put((media_type, source, external_id), tmdb_id,
+                        self.not_found_ttl.total_seconds() if tmdb_id == NOT_FOUND else None)
+        self.db.execute("INSERT OR REPLACE INTO tmdb_ids (media_type, source, external_id, tmdb_id, timestamp) VALUES (?, ?, ?, ?, ?)",
+                        (media_type, source, external_id, tmdb_id, datetime.now().isoformat()))
+
+    def _migrated(self, key: str) -> bool:
+        return self.db.query("SELECT 1 FROM meta WHERE key = ?", (key,), one=True) is not None
+
+    def _mark_migrated(self, key: str, count: int):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(count)))
+        self.db.flush()
+        logging.info(f"Imported {count} cache entries ({key})")
+
+    # One-shot import of the Radarr script's per-movie JSON files (CACHE_DIR/tmdb_cache/<id>.json).
+    def migrate_json_cache(self, cache_dir: Optional[str], media_type: str = "movie"):
+        key = f"migrated:{media_type}:json"
+        json_dir = os.path.join(cache_dir or ".", "tmdb_cache")
+        if self._migrated(key) or not os.path.isdir(json_dir):
+            return
+        rows = []
+        for entry in os.scandir(json_dir):
+            name, ext = os.path.splitext(entry.name)
+            if ext != ".json" or not name.isdigit():
+                continue
+            try:
+                with open(entry.path, "r") as f:
+                    data = json.load(f)
+                rows.append((media_type, int(name), float(data["rating"]), data["timestamp"]))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logging.warning(f"Skipping unreadable cache file {entry.path} ({e})")
+        self.db.executemany("INSERT OR IGNORE INTO ratings (media_type, tmdb_id, rating, timestamp) VALUES (?, ?, ?, ?)", rows)
+        self._mark_migrated(key, len(rows))
+
+    # One-shot import of the legacy ratings.db: the Sonarr script's ratings (newest
+    # row per TMDB id) and the TMDB id mappings both scripts kept there.
+    def migrate_ratings_db(self, path: str = "ratings.db"):
+        key = "migrated:ratings_db"
+        if self._migrated(key) or not os.path.exists(path):
+            return
+        legacy = sqlite3.connect(path)
+        try:
+            rows = legacy.execute("SELECT tmdb_id, rating, MAX(timestamp) FROM ratings GROUP BY tmdb_id").fetchall()
+            id_rows = []
+            if legacy.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tmdb_ids'").fetchone():
+                id_rows = legacy.execute("SELECT media_type, source, external_id, tmdb_id, timestamp FROM tmdb_ids").fetchall()
+        except sqlite3.DatabaseError as e:
+            logging.warning(f"Could not read legacy cache {path} ({e})")
+            rows, id_rows = [], []
+        finally:
+            legacy.close()
+        self.db.executemany("INSERT OR IGNORE INTO ratings (media_type, tmdb_id, rating, timestamp) VALUES (?, ?, ?, ?)",
+                            [("tv", *row) for row in rows])
+        self.db.executemany("INSERT OR IGNORE INTO tmdb_ids (media_type, source, external_id, tmdb_id, timestamp) VALUES (?, ?, ?, ?, ?)",
+                            id_rows)
+        self._mark_migrated(key, len(rows) + len(id_rows))
+
+    def report(self):
+        lookups = self.stats["rating_hit"] + self.stats["rating_miss"]
+        hit_ratio = self.stats["rating_hit"] / lookups if lookups else 0
+        logging.info(f"Rating cache: {self.stats['rating_hit']}/{lookups} hits ({hit_ratio:.0%}), "
+                     f"{self.stats['rating_stale']} stale ratings used while refreshing. "
+                     f"TMDB id lookups: {self.stats['id_direct']} direct, {self.stats['id_cached']} cached, "
+                     f"{self.stats['id_find']} via /find, {self.stats['id_search']} via title search, "
+                     f"{self.stats['id_not_found']} not found. {self.stats['memory_hit']} lookups served from memory"
+                     + (f", {self.stats['tmdb_shared']} TMDB requests shared between instances" if self.stats['tmdb_shared'] else ""))
@@ -0,0 +1,28 @@
+import importlib
+import os
+import sys
+from typing import List, Optional
+
+# Mode name -> script module. Only the chosen module (and what it imports) is loaded.
+MODES = {
+    "sonarr": "downgraderr",
+    "radarr": "downgraderr_radarr",
+    "lidarr": "downgraderr_lidarr",
+    "warm-cache": "downgraderr_core.warm",
+    "multi": "downgraderr_core.instances",
+    "audit": "downgraderr_core.audit",
+    "plan-diff": "downgraderr_core.plan",
+}
+
+USAGE = f"usage: python -m downgraderr_core {{{','.join(MODES)}}} [options]"
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in MODES:
+        print(USAGE, file=sys.stderr)
+        sys.exit(0 if argv and argv[0] in ("-h", "--help") else 2)
+    # The scripts live next to the package; make them importable from any working directory
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    importlib.import_module(MODES[argv[0]]).run(argv[1:], prog=f"python -m downgraderr_core {argv[0]}")
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import signal
+import time
+from typing import Awaitable, Callable
+
+DEFAULT_DAEMON_INTERVAL = 3600
+
+# Signals that start a sweep right away instead of waiting for the interval.
+WAKEUP_SIGNALS = ("SIGHUP", "SIGUSR1")
+
+# Run `sweep` now, then every `interval` seconds or whenever SIGHUP/SIGUSR1
+# arrives, until cancelled. A failed sweep is logged and retried on the next tick.
+async def run_daemon(sweep: Callable[[], Awaitable[None]], interval: float = DEFAULT_DAEMON_INTERVAL):
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    task = asyncio.current_task()
+    handled = []
+    for name in WAKEUP_SIGNALS + ("SIGTERM",):
+        signum = getattr(signal, name, None)
+        if signum is None:
+            continue
+        try:
+            # SIGTERM cancels the sweep so the caller can close the cache cleanly.
+            loop.add_signal_handler(signum, task.cancel if name == "SIGTERM" else wakeup.set)
+        except (NotImplementedError, RuntimeError):
+            continue
+        handled.append(signum)
+
+    sweeps = 0
+    try:
+        while True:
+            wakeup.clear()
+            started = time.monotonic()
+            try:
+                await sweep()
+            except Exception as e:
+                logging.error(f"Sweep failed: {e}")
+            sweeps += 1
+            logging.info(f"Sweep {sweeps} took {time.monotonic() - started:.2f} seconds, next in {interval:.0f} seconds or on SIGHUP")
+            try:
+                await asyncio.wait_for(wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        for signum in handled:
+            loop.remove_signal_handler(signum)
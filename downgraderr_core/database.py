@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+from downgraderr_core.metrics import Metrics
+
+# Rows written before a commit is forced.
+DEFAULT_BATCH_SIZE = 500
+
+# Seconds a write may wait for others to share its commit (CACHE_COMMIT_INTERVAL).
+DEFAULT_COMMIT_INTERVAL = 1.0
+
+_WRITE, _CALL, _COMMIT, _CLOSE = range(4)
+
+# One SQLite connection owned by a dedicated thread. Writes are queued without
+# waiting and committed in groups: when `batch_size` rows are pending, or
+# `commit_interval` seconds after the first uncommitted one. Reads are run by the
+# same thread in queue order, so they see every write queued before them,
+# committed or not, and never block the event loop (fetch()). Nothing else
+# touches the connection, so statements can never interleave.
+class Database:
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 commit_interval: float = DEFAULT_COMMIT_INTERVAL, metrics: Optional[Metrics] = None):
+        self.path = path
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        # SQLite read, write and commit latency ("read", "write", "commit"), measured on the thread
+        self.metrics = metrics or Metrics()
+        self.queue = queue.SimpleQueue()
+        # Only the thread uses these
+        self.pending = 0
+        self.first_pending = 0.0
+        self.commits = 0
+        self.failed_writes = 0
+        opened = Future()
+        self.thread = threading.Thread(target=self._run, args=(opened,), name=f"sqlite {os.path.basename(path)}", daemon=True)
+        self.thread.start()
+        # Connection errors are raised here, in the caller
+        opened.result()
+
+    def _run(self, opened: Future):
+        try:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as e:
+            opened.set_exception(e)
+            return
+        opened.set_result(None)
+        while True:
+            try:
+                kind, payload, future = self.queue.get(timeout=self.commit_interval) if self.pending else self.queue.get()
+            except queue.Empty:
+                self._commit(conn)
+                continue
+            if kind == _WRITE:
+                self._write(conn, *payload)
+            elif kind == _CALL:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(payload(conn))
+                    except BaseException as e:
+                        future.set_exception(e)
+            else:
+                self._commit(conn)
+                if kind == _CLOSE:
+                    conn.close()
+                    future.set_result(None)
+                    return
+                future.set_result(None)
+
+    def _write(self, conn: sqlite3.Connection, sql: str, rows: Sequence, many: bool):
+        started = time.perf_counter()
+        try:
+            if many:
+                conn.executemany(sql, rows)
+            else:
+                conn.execute(sql, rows)
+        except sqlite3.Error as e:
+            # Nobody waits for a write; a failed one is logged and the rest carry on
+            self.failed_writes += 1
+            logging.error(f"Cache write failed ({e}): {sql.split('(')[0].strip()}")
+            return
+        self.metrics.observe("write", time.perf_counter() - started)
+        if not self.pending:
+            self.first_pending = time.monotonic()
+        self.pending += len(rows) if many else 1
+        if self.pending >= self.batch_size or time.monotonic() - self.first_pending >= self.commit_interval:
+            self._commit(conn)
+
+    def _commit(self, conn: sqlite3.Connection):
+        if not self.pending:
+            return
+        started = time.perf_counter()
+        try:
+            conn.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Cache commit failed ({e})")
+        self.metrics.observe("commit", time.perf_counter() - started)
+        self.commits += 1
+        self.pending = 0
+
+    # Queue a write; returns at once.
+    def execute(self, sql: str, params: Sequence = ()):
+        self.queue.put((_WRITE, (sql, params, False), None))
+
+    def executemany(self, sql: str, rows: Iterable[Sequence]):
+        rows = list(rows)
+        if rows:
+            self.queue.put((_WRITE, (sql, rows, True), None))
+
+    # Run `function(connection)` on the thread, after everything queued before it.
+    def submit(self, function: Callable[[sqlite3.Connection], Any]) -> Future:
+        future = Future()
+        self.queue.put((_CALL, function, future))
+        return future
+
+    def _reader(self, sql: str, params: Sequence, one: bool) -> Callable[[sqlite3.Connection], Any]:
+        def read(conn: sqlite3.Connection):
+            with self.metrics.timer("read"):
+                cursor = conn.execute(sql, params)
+                return cursor.fetchone() if one else cursor.fetchall()
+        return read
+
+    # Blocking read, for start-up and command line code outside the event loop.
+    def query(self, sql: str, params: Sequence = (), one: bool = False) -> Any:
+        return self.submit(self._reader(sql, params, one)).result()
+
+    # Read without blocking the event loop.
+    async def fetch(self, sql: str, params: Sequence = (), one: bool = False) -> Any:
+        return await asyncio.wrap_future(self.submit(self._reader(sql, params, one)))
+
+    # Blocking: schema set-up.
+    def executescript(self, sql: str):
+        self.submit(lambda conn: conn.executescript(sql)).result()
+
+    # Commit whatever is pending now rather than at the end of its group; the
+    # returned future is done once it is committed.
+    def commit(self) -> Future:
+        future = Future()
+        self.queue.put((_COMMIT, None, future))
+        return future
+
+    # Commit and wait for it.
+    def flush(self):
+        self.commit().result()
+
+    def close(self):
+        if not self.thread.is_alive():
+            return
+        future = Future()
+        self.queue.put((_CLOSE, None, future))
+        future.result()
+        self.thread.join()
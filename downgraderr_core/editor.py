@@ -0,0 +1,95 @@
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+DEFAULT_CHUNK_SIZE = 200
+
+class ProfileChange:
+    __slots__ = ('item_id', 'title', 'old_profile_id', 'new_profile_id', 'rule', 'suppressed')
+
+    def __init__(self, item_id: int, title: str, old_profile_id: int, new_profile_id: int, rule: Optional[str] = None,
+                 suppressed: bool = False):
+        self.item_id = item_id
+        self.title = title
+        self.old_profile_id = old_profile_id
+        self.new_profile_id = new_profile_id
+        self.rule = rule
+        # A move held back as flapping: the item stays on old_profile_id
+        self.suppressed = suppressed
+
+# Collects profile decisions during a run and applies them through the *arr bulk
+# editor endpoint (/series/editor, /movie/editor): one small PUT per chunk of ids
+# sharing a target profile, instead of a GET and a full-object PUT per item.
+class BulkEditor:
+    def __init__(self, scheduler, editor_url: str, ids_field: str, headers: Dict[str, str],
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.scheduler = scheduler
+        self.editor_url = editor_url
+        self.ids_field = ids_field
+        self.headers = headers
+        self.chunk_size = max(chunk_size, 1)
+        self.pending = defaultdict(list)
+        self.unchanged = 0
+        self.suppressed = 0
+        self.requests = 0
+        self.applied = 0
+        self.failed: List[ProfileChange] = []
+
+    # Queue a decision; returns False when the item already has that profile or
+    # the move was suppressed as flapping.
+    def queue(self, change: ProfileChange) -> bool:
+        if change.suppressed:
+            self.suppressed += 1
+            return False
+        if change.old_profile_id == change.new_profile_id:
+            self.unchanged += 1
+            return False
+        self.pending[change.new_profile_id].append(change)
+        return True
+
+    # Queued changes, grouped by target profile.
+    def changes(self) -> List[ProfileChange]:
+        return [change for profile_id in sorted(self.pending) for change in self.pending[profile_id]]
+
+    async def _apply_chunk(self, session, profile_id: int, chunk: List[ProfileChange]) -> bool:
+        ids = [change.item_id for change in chunk]
+        self.requests += 1
+        try:
+            with self.scheduler.metrics.timer("update"):
+                await self.scheduler.request(session, "PUT", self.editor_url, headers=self.headers,
+                                             json={self.ids_field: ids, "qualityProfileId": profile_id})
+        except Exception as e:
+            logging.error(f"Failed to move {len(ids)} items to profile {profile_id} ({e}): {ids}")
+            self.failed.extend(chunk)
+            return False
+        logging.info(f"Moved {len(ids)} items to profile {profile_id}")
+        self.applied += len(chunk)
+        return True
+
+    # Apply every full chunk queued so far, so changes go out while the library is
+    # still being evaluated instead of piling up until the end of the run.
+    async def apply_full_chunks(self, session) -> List[ProfileChange]:
+        applied = []
+        for profile_id, changes in list(self.pending.items()):
+            while len(changes) >= self.chunk_size:
+                chunk = changes[:self.chunk_size]
+                del changes[:self.chunk_size]
+                if await self._apply_chunk(session, profile_id, chunk):
+                    applied.extend(chunk)
+        return applied
+
+    # Apply all queued changes and return the ones that succeeded. A failing chunk
+    # is logged with its ids and does not stop the others.
+    async def apply(self, session) -> List[ProfileChange]:
+        applied = []
+        for profile_id, changes in sorted(self.pending.items()):
+            for start in range(0, len(changes), self.chunk_size):
+                chunk = changes[start:start + self.chunk_size]
+                if await self._apply_chunk(session, profile_id, chunk):
+                    applied.extend(chunk)
+        self.pending.clear()
+        return applied
+
+    def report(self):
+        logging.info(f"Bulk editor: {self.applied} changes in {self.requests} requests, {len(self.failed)} failed, "
+                     f"{self.unchanged} items already on the right profile, {self.suppressed} suppressed (flapping)")
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+# Event types that can change a decision input: the item was added, or files were
+# imported (which is also when Sonarr/Radarr have just refreshed its metadata).
+# None of the apps sends an event when an item's status changes (a series ending,
+# a movie being released) or its metadata is refreshed; the next sweep (a scheduled
+# run or --daemon) picks those up, as the status is part of the item's fingerprint.
+TRIGGER_EVENTS = {
+    "sonarr": {"SeriesAdd", "Download"},
+    "radarr": {"MovieAdded", "Download"},
+    "lidarr": {"ArtistAdd", "Download"},
+}
+
+# Custom Script environment variables: (event type, item id).
+ENV_VARS = {
+    "sonarr": ("sonarr_eventtype", "sonarr_series_id"),
+    "radarr": ("radarr_eventtype", "radarr_movie_id"),
+    "lidarr": ("lidarr_eventtype", "lidarr_artist_id"),
+}
+
+# Key of the item object in a webhook payload.
+PAYLOAD_KEYS = {
+    "sonarr": "series",
+    "radarr": "movie",
+    "lidarr": "artist",
+}
+
+DEFAULT_WEBHOOK_DELAY = 5
+
+# Event type and item id of a Custom Script invocation, or None when the process
+# was not started by Sonarr, Radarr or Lidarr.
+def event_from_env(app: str, environ: Mapping[str, str]) -> Optional[Tuple[str, Optional[int]]]:
+    type_var, id_var = ENV_VARS[app]
+    event_type = environ.get(type_var)
+    if event_type is None:
+        return None
+    item_id = environ.get(id_var)
+    return event_type, int(item_id) if item_id and item_id.isdigit() else None
+
+# Event type and item id of a webhook payload.
+def event_from_payload(app: str, payload: Dict) -> Tuple[Optional[str], Optional[int]]:
+    if not isinstance(payload, dict):
+        return None, None
+    item = payload.get(PAYLOAD_KEYS[app]) or {}
+    item_id = item.get("id")
+    return payload.get("eventType"), item_id if isinstance(item_id, int) else None
+
+# Collects item ids from events and hands them to `handler` in batches, so a
+# season pack import (one event per episode) is evaluated once.
+class EventBatcher:
+    def __init__(self, handler: Callable[[List[int]], Awaitable[None]], delay: float = DEFAULT_WEBHOOK_DELAY):
+        self.handler = handler
+        self.delay = delay
+        self.pending = set()
+        self.wakeup = asyncio.Event()
+        self.received = 0
+        self.batches = 0
+
+    def add(self, item_id: int):
+        self.received += 1
+        self.pending.add(item_id)
+        self.wakeup.set()
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(self.delay)
+            self.wakeup.clear()
+            item_ids, self.pending = sorted(self.pending), set()
+            self.batches += 1
+            try:
+                await self.handler(item_ids)
+            except Exception as e:
+                # One bad batch must not stop the receiver; these items are retried on the next event.
+                logging.error(f"Failed to update items {item_ids}: {e}")
+
+# Receive Sonarr/Radarr/Lidarr webhooks (Settings > Connect > Webhook, POST to
+# http://HOST:PORT/webhook) and evaluate the items they mention. Runs until cancelled.
+async def serve_webhooks(app: str, handler: Callable[[List[int]], Awaitable[None]], host: str, port: int,
+                         delay: float = DEFAULT_WEBHOOK_DELAY, token: Optional[str] = None):
+    from aiohttp import web
+
+    batcher = EventBatcher(handler, delay)
+
+    async def receive(request):
+        if token and request.query.get("token") != token:
+            return web.json_response({"error": "invalid token"}, status=401)
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({"error": "invalid JSON"}, status=400)
+        event_type, item_id = event_from_payload(app, payload)
+        if event_type not in TRIGGER_EVENTS[app] or item_id is None:
+            logging.debug(f"Ignoring {app} event {event_type}")
+            return web.json_response({"ignored": event_type})
+        logging.info(f"Received {app} event {event_type} for item {item_id}")
+        batcher.add(item_id)
+        return web.json_response({"queued": item_id}, status=202)
+
+    web_app = web.Application()
+    web_app.router.add_post("/webhook", receive)
+    runner = web.AppRunner(web_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Listening for {app} webhooks on http://{host}:{port}/webhook")
+    try:
+        await batcher.run()
+    finally:
+        await runner.cleanup()
+        logging.info(f"Webhook receiver: {batcher.received} events, {batcher.batches} batches")
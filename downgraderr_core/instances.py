@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import contextvars
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from downgraderr_core.cache import MetadataCache
+from downgraderr_core.metrics import write_json_report, write_prometheus
+from downgraderr_core.scheduler import Scheduler
+from downgraderr_core.script import ArrScript
+from downgraderr_core.startup import process_started, report_startup
+
+# APP -> (script module, its ArrScript class). Each instance gets its own object,
+# so configuration and storage stay per instance.
+SCRIPTS = {
+    "sonarr": ("downgraderr", "SonarrScript"),
+    "radarr": ("downgraderr_radarr", "RadarrScript"),
+    "lidarr": ("downgraderr_lidarr", "LidarrScript"),
+}
+
+# Keys of an INSTANCES entry that describe the entry rather than configure the script.
+INSTANCE_KEYS = ("NAME", "APP", "CONFIG")
+
+# Name of the instance the current task works for, prefixed to its log lines.
+current_instance: contextvars.ContextVar[str] = contextvars.ContextVar("current_instance", default="")
+
+class InstanceFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        name = current_instance.get()
+        record.instance = f"[{name}] " if name else ""
+        return True
+
+class Instance:
+    __slots__ = ('name', 'app', 'config', 'script', 'summary', 'error', 'elapsed')
+
+    def __init__(self, name: str, app: str, config: Dict[str, Any]):
+        self.name = name
+        self.app = app
+        self.config = config
+        self.script = None
+        self.summary: Optional[Dict[str, int]] = None
+        self.error: Optional[str] = None
+        self.elapsed = 0.0
+
+# A fresh, unconfigured script object for an app.
+def load_script(app: str) -> ArrScript:
+    module, name = SCRIPTS[app]
+    return getattr(importlib.import_module(module), name)()
+
+# Config of every instance: the top-level keys (shared settings such as TMDB_API_KEY
+# and CACHE_DIR), then the entry's CONFIG file (an existing per-script config), then
+# the keys set in the entry itself.
+def read_instances(config: Dict[str, Any], base_dir: str = ".") -> List[Instance]:
+    shared = {key: value for key, value in config.items() if key != "INSTANCES"}
+    instances = []
+    for entry in config.get("INSTANCES", []):
+        name = entry.get("NAME")
+        app = entry.get("APP", "").lower()
+        if not name:
+            raise ValueError("Every entry in INSTANCES needs a NAME")
+        if app not in SCRIPTS:
+            raise ValueError(f"Instance '{name}': APP must be one of {', '.join(SCRIPTS)}")
+        if any(instance.name == name for instance in instances):
+            raise ValueError(f"Instance name '{name}' is used more than once")
+        merged = dict(shared)
+        if entry.get("CONFIG"):
+            with open(os.path.join(base_dir, entry["CONFIG"]), 'r') as file:
+                merged.update(json.load(file))
+        merged.update({key: value for key, value in entry.items() if key not in INSTANCE_KEYS})
+        instances.append(Instance(name, app, merged))
+    if not instances:
+        raise ValueError("INSTANCES lists no instances")
+    return instances
+
+async def run_instance(instance: Instance, full: bool, plan_dir: Optional[str]):
+    # Set in this task's own context, so it applies to this instance's log lines only
+    current_instance.set(instance.name)
+    started = time.monotonic()
+    plan_path = os.path.join(plan_dir, f"{instance.name}.jsonl") if plan_dir else None
+    try:
+        instance.summary = await instance.script.main(full=full, dry_run=bool(plan_dir), plan_path=plan_path)
+    except Exception as e:
+        instance.error = str(e) or type(e).__name__
+        logging.error(f"Run failed: {instance.error}")
+    instance.elapsed = time.monotonic() - started
+
+def report(instances: List[Instance], elapsed: float):
+    failed = [instance for instance in instances if instance.error]
+    logging.info(f"Summary: {len(instances)} instances in {elapsed:.2f} seconds, {len(failed)} failed")
+    totals = {"items": 0, "evaluated": 0, "changes": 0, "failed": 0}
+    for instance in instances:
+        if instance.error:
+            logging.error(f"  {instance.name} ({instance.app}): failed after {instance.elapsed:.2f} seconds: {instance.error}")
+            continue
+        summary = instance.summary or {}
+        for key in totals:
+            totals[key] += summary.get(key, 0)
+        logging.info(f"  {instance.name} ({instance.app}): {summary.get('items', 0)} items, {summary.get('evaluated', 0)} evaluated, "
+                     f"{summary.get('changes', 0)} changes, {summary.get('failed', 0)} failed in {instance.elapsed:.2f} seconds")
+    logging.info(f"  total: {totals['items']} items, {totals['evaluated']} evaluated, "
+                 f"{totals['changes']} changes, {totals['failed']} failed")
+
+# The instances' run reports in one JSON file and one Prometheus textfile, labelled
+# by instance. The cache figures are those of the shared cache.
+def write_reports(instances: List[Instance], elapsed: float, report_path: Optional[str], prometheus_path: Optional[str]):
+    reports = [instance.script.last_report for instance in instances if instance.script.last_report]
+    if report_path:
+        write_json_report(report_path, {"duration_seconds": round(elapsed, 3), "instances": reports,
+                                        "failed": {instance.name: instance.error for instance in instances if instance.error}})
+    if prometheus_path:
+        write_prometheus(prometheus_path, reports)
+
+# Command line entry point: `python -m downgraderr_core multi`. Runs every instance
+# in INSTANCES concurrently in one process, with one TMDB rate limit and one
+# metadata cache for all of them.
+def run(argv: Optional[List[str]] = None, prog: Optional[str] = None):
+    started = process_started()
+    parser = argparse.ArgumentParser(prog=prog, description="Assign quality profiles on several Sonarr, Radarr and Lidarr instances at once.")
+    parser.add_argument('--config', metavar='FILE', default='instances.json', help="instances config file (default: instances.json)")
+    parser.add_argument('--full', action='store_true', help="re-evaluate every item, not only those whose inputs changed")
+    parser.add_argument('--plan-dir', metavar='DIR', help="dry run that writes each instance's plan to DIR/NAME.jsonl")
+    parser.add_argument('--instance', metavar='NAME', action='append', help="run only this instance (repeatable)")
+    parser.add_argument('--verbose', '-v', action='store_true', help="also log every item's decision (DEBUG)")
+    parser.add_argument('--report', metavar='FILE', help="write a JSON run report for all instances to FILE")
+    parser.add_argument('--prometheus', metavar='FILE', help="write all instances' metrics to FILE for the node_exporter textfile collector")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(instance)s%(message)s')
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(InstanceFilter())
+
+    with open(args.config, 'r') as file:
+        config = json.load(file)
+    try:
+        instances = read_instances(config, os.path.dirname(os.path.abspath(args.config)))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.instance:
+        unknown = set(args.instance) - {instance.name for instance in instances}
+        if unknown:
+            parser.error(f"unknown instance {', '.join(sorted(unknown))}")
+        instances = [instance for instance in instances if instance.name in args.instance]
+    if args.plan_dir:
+        os.makedirs(args.plan_dir, exist_ok=True)
+
+    # One cache and one TMDB limiter (RATE_LIMITS.tmdb at the top level) for all
+    # instances; everything else, the *arr rate limit and ITEM_CONCURRENCY
+    # included, is per instance.
+    cache = MetadataCache.from_config(config)
+    cache.migrate_json_cache(config.get('CACHE_DIR'))
+    cache.migrate_ratings_db('ratings.db')
+    tmdb_limiter = Scheduler.from_config(config, {}).limiters["tmdb"]
+    for instance in instances:
+        # Bad config fails here, before any instance sends a request
+        instance.script = load_script(instance.app)
+        instance.script.configure(instance.config)
+        # One combined report for the run instead of one file per instance
+        instance.script.report_path = instance.script.prometheus_path = None
+        instance.script.scheduler.share_limiter("tmdb", tmdb_limiter)
+        instance.script.open_storage(cache, instance.name)
+
+    async def run_all():
+        await asyncio.gather(*(run_instance(instance, args.full, args.plan_dir) for instance in instances))
+
+    run_started = time.monotonic()
+    try:
+        asyncio.run(run_all())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for instance in instances:
+            instance.script.close_storage()
+        elapsed = time.monotonic() - run_started
+        report(instances, elapsed)
+        cache.report()
+        cache.close()
+    write_reports(instances, elapsed, args.report or config.get('RUN_REPORT'),
+                  args.prometheus or config.get('PROMETHEUS_TEXTFILE'))
+    first_requests = [instance.script.scheduler.first_request for instance in instances if instance.script.scheduler.first_request]
+    report_startup(started, min(first_requests, default=None), config.get('STARTUP_BUDGET_MS', 1000))
+    if any(instance.error for instance in instances):
+        sys.exit(1)
@@ -0,0 +1,190 @@
+import json
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Upper bounds of the latency buckets, in seconds; one more bucket catches the rest.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Fixed-bucket latency histogram: recording is a bisect and two additions, so it
+# can sit on every request and every item.
+class Histogram:
+    __slots__ = ('counts', 'total', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    # Upper bound of the bucket holding the q-th quantile, capped at the maximum seen.
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+        return 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {"count": self.count, "sum": round(self.total, 6), "mean": round(self.total / self.count, 6) if self.count else 0,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99), "max": round(self.max, 6),
+                "buckets": {str(bound): count for bound, count in zip(BUCKETS + ("+Inf",), self.counts) if count}}
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+# Per-phase latency histograms and request counts of one run.
+class Metrics:
+    def __init__(self):
+        self.phases: Dict[str, Histogram] = {}
+        # (host group, "METHOD /path"), status -> count
+        self.requests: Counter = Counter()
+        self.started = time.time()
+
+    def reset(self):
+        self.phases.clear()
+        self.requests.clear()
+        self.started = time.time()
+
+    def histogram(self, phase: str) -> Histogram:
+        histogram = self.phases.get(phase)
+        if histogram is None:
+            histogram = self.phases[phase] = Histogram()
+        return histogram
+
+    def observe(self, phase: str, seconds: float):
+        self.histogram(phase).observe(seconds)
+
+    # `with metrics.timer("decide"):` records how long the block took; works in coroutines too.
+    def timer(self, phase: str) -> _Timer:
+        return _Timer(self.histogram(phase))
+
+    def count_request(self, group: str, endpoint: str, status: str):
+        self.requests[(group, endpoint, status)] += 1
+
+    def phase_summaries(self) -> Dict[str, Dict[str, Any]]:
+        return {phase: histogram.summary() for phase, histogram in sorted(self.phases.items())}
+
+    def request_counts(self) -> Dict[str, Dict[str, int]]:
+        counts: Dict[str, Dict[str, int]] = {}
+        for (group, endpoint, status), count in sorted(self.requests.items()):
+            counts.setdefault(f"{group} {endpoint}", {})[status] = count
+        return counts
+
+# "/series/123" -> "/series/{id}", "/find/tt0944947" -> "/find/{id}", so requests
+# group by endpoint rather than by item.
+def endpoint_path(path: str) -> str:
+    return re.sub(r"/(?:tt)?\d+(?=/|$)", "/{id}", path)
+
+# JSON run report(s) as built by build_report().
+def write_json_report(path: str, report: Any):
+    _write_atomic(path, json.dumps(report, indent=2, default=str) + "\n")
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: Dict[str, Any]) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+# Prometheus text exposition of one or more run reports, for node_exporter's
+# textfile collector. Written to a temporary file and renamed, so the collector
+# never reads a half-written file.
+def write_prometheus(path: str, reports: List[Dict[str, Any]]):
+    lines: List[str] = []
+    types: Dict[str, Tuple[str, str]] = {
+        "downgraderr_phase_seconds": ("histogram", "Time spent per phase"),
+        "downgraderr_requests_total": ("counter", "HTTP responses per endpoint and status"),
+        "downgraderr_retries_total": ("counter", "Retried HTTP requests"),
+        "downgraderr_throttled_total": ("counter", "429 responses per host group"),
+        "downgraderr_cache_hit_ratio": ("gauge", "Rating cache hit ratio of the last run"),
+        "downgraderr_items": ("gauge", "Items of the last run by outcome"),
+        "downgraderr_run_duration_seconds": ("gauge", "Duration of the last run"),
+        "downgraderr_last_run_timestamp_seconds": ("gauge", "End of the last run"),
+    }
+    samples: Dict[str, List[str]] = {name: [] for name in types}
+    for report in reports:
+        base = {"app": report.get("app", ""), "instance": report.get("instance", "")}
+        for phase, summary in report.get("phases", {}).items():
+            cumulative = 0
+            counts = summary["buckets"]
+            for bound in BUCKETS + ("+Inf",):
+                cumulative += counts.get(str(bound), 0)
+                samples["downgraderr_phase_seconds"].append(
+                    f"downgraderr_phase_seconds_bucket{_labels({**base, 'phase': phase, 'le': bound})} {cumulative}")
+            samples["downgraderr_phase_seconds"].append(f"downgraderr_phase_seconds_sum{_labels({**base, 'phase': phase})} {summary['sum']}")
+            samples["downgraderr_phase_seconds"].append(f"downgraderr_phase_seconds_count{_labels({**base, 'phase': phase})} {summary['count']}")
+        for endpoint, statuses in report.get("requests", {}).items():
+            group, _, endpoint = endpoint.partition(" ")
+            for status, count in statuses.items():
+                samples["downgraderr_requests_total"].append(
+                    f"downgraderr_requests_total{_labels({**base, 'group': group, 'endpoint': endpoint, 'status': status})} {count}")
+        samples["downgraderr_retries_total"].append(f"downgraderr_retries_total{_labels(base)} {report.get('retries', 0)}")
+        for group, count in report.get("throttled", {}).items():
+            samples["downgraderr_throttled_total"].append(f"downgraderr_throttled_total{_labels({**base, 'group': group})} {count}")
+        cache = report.get("cache", {})
+        if "rating_hit_ratio" in cache:
+            samples["downgraderr_cache_hit_ratio"].append(f"downgraderr_cache_hit_ratio{_labels({**base, 'cache': 'rating'})} {cache['rating_hit_ratio']}")
+        for outcome, count in report.get("items", {}).items():
+            samples["downgraderr_items"].append(f"downgraderr_items{_labels({**base, 'outcome': outcome})} {count}")
+        samples["downgraderr_run_duration_seconds"].append(f"downgraderr_run_duration_seconds{_labels(base)} {report.get('duration_seconds', 0)}")
+        samples["downgraderr_last_run_timestamp_seconds"].append(
+            f"downgraderr_last_run_timestamp_seconds{_labels(base)} {report.get('finished', time.time())}")
+    for name, (kind, description) in types.items():
+        if samples[name]:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples[name])
+    _write_atomic(path, "\n".join(lines) + "\n")
+
+def _write_atomic(path: str, text: str):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    temporary = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    with open(temporary, 'w') as file:
+        file.write(text)
+    os.replace(temporary, path)
+
+# One report per run: wall time, this run's phase and request metrics, the
+# scheduler's retry and 429 counters and the cache's hit ratios.
+def build_report(app: str, instance: str, run_id: Optional[str], metrics: Metrics, scheduler, cache,
+                 items: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    finished = time.time()
+    lookups = cache.stats["rating_hit"] + cache.stats["rating_miss"]
+    phases = metrics.phase_summaries()
+    phases.update({f"cache_{phase}": summary for phase, summary in cache.metrics.phase_summaries().items()})
+    return {
+        "app": app,
+        "instance": instance,
+        "run_id": run_id,
+        "started": metrics.started,
+        "finished": finished,
+        "duration_seconds": round(finished - metrics.started, 3),
+        "items": items or {},
+        "phases": phases,
+        "requests": metrics.request_counts(),
+        "retries": scheduler.retries,
+        "throttled": {name: limiter.throttled for name, limiter in scheduler.limiters.items()},
+        "cache": {**dict(cache.stats), "rating_hit_ratio": round(cache.stats["rating_hit"] / lookups, 4) if lookups else 0},
+    }
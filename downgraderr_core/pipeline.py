@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+DEFAULT_QUEUE_SIZE = 256
+
+# (name, async function, number of workers). A stage returns the item for the
+# next stage, or None to drop it (e.g. an unchanged item in an incremental run).
+Stage = Tuple[str, Callable[[Any], Awaitable[Optional[Any]]], int]
+
+_DONE = object()
+
+# Peak resident set size of this process so far, in MiB (ru_maxrss is KiB on Linux).
+def peak_rss_mib() -> float:
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Staged pipeline (fetch -> enrich -> decide -> apply) connected by bounded
+# queues. Items flow through as the source yields them and a full queue makes
+# the previous stage wait, so the number of items in memory stays bounded by
+# the queue sizes and worker counts, not by the size of the library.
+class Pipeline:
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.queue_size = max(queue_size, 1)
+        self.in_flight = 0
+        self.high_water = 0
+        self.counts = {}
+
+    def _enter(self):
+        self.in_flight += 1
+        self.high_water = max(self.high_water, self.in_flight)
+
+    async def run(self, source: AsyncIterator[Any], stages: List[Stage]):
+        stages = [(name, func, max(workers, 1)) for name, func, workers in stages]
+        queues = [asyncio.Queue(self.queue_size) for _ in stages]
+        self.counts = {name: 0 for name, _, _ in stages}
+
+        async def feed():
+            async for item in source:
+                self._enter()
+                await queues[0].put(item)
+            for _ in range(stages[0][2]):
+                await queues[0].put(_DONE)
+
+        async def work(index: int):
+            name, func, _ = stages[index]
+            last = index == len(stages) - 1
+            while (item := await queues[index].get()) is not _DONE:
+                result = await func(item)
+                self.counts[name] += 1
+                if result is None or last:
+                    self.in_flight -= 1
+                else:
+                    await queues[index + 1].put(result)
+
+        async def run_stage(index: int):
+            await asyncio.gather(*(work(index) for _ in range(stages[index][2])))
+            if index + 1 < len(stages):
+                for _ in range(stages[index + 1][2]):
+                    await queues[index + 1].put(_DONE)
+
+        tasks = [asyncio.ensure_future(feed())] + [asyncio.ensure_future(run_stage(i)) for i in range(len(stages))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    def report(self):
+        stages = ", ".join(f"{name}: {count}" for name, count in self.counts.items())
+        logging.info(f"Pipeline: items per stage ({stages}), at most {self.high_water} items in flight, "
+                     f"peak RSS {peak_rss_mib():.1f} MiB")
@@ -0,0 +1,108 @@
+import argparse
+import csv
+import json
+import logging
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from downgraderr_core.editor import BulkEditor, ProfileChange
+
+PLAN_FIELDS = ['item_id', 'title', 'current_profile_id', 'current_profile', 'proposed_profile_id', 'proposed_profile', 'rule']
+# Extra columns of a space budget plan (--free); --apply ignores them.
+ESTIMATE_FIELDS = ['size_on_disk', 'estimated_reclaimed']
+
+def _plan_rows(changes: Iterable[ProfileChange], profile_names: Dict[int, str],
+               estimates: Optional[Dict[int, Tuple[int, int]]] = None):
+    for change in changes:
+        row = {
+            'item_id': change.item_id,
+            'title': change.title,
+            'current_profile_id': change.old_profile_id,
+            'current_profile': profile_names.get(change.old_profile_id, ''),
+            'proposed_profile_id': change.new_profile_id,
+            'proposed_profile': profile_names.get(change.new_profile_id, ''),
+            'rule': change.rule or '',
+        }
+        if estimates is not None:
+            row['size_on_disk'], row['estimated_reclaimed'] = estimates.get(change.item_id, (0, 0))
+        yield row
+
+# Write proposed changes as JSONL, or CSV when the path ends in .csv. No path means JSONL on stdout.
+# `estimates` (item id -> size on disk, estimated bytes reclaimed) adds the budget columns.
+def write_plan(path: Optional[str], changes: List[ProfileChange], profile_names: Dict[int, str],
+               estimates: Optional[Dict[int, Tuple[int, int]]] = None):
+    rows = _plan_rows(changes, profile_names, estimates)
+    out = open(path, 'w', newline='') if path else sys.stdout
+    try:
+        if path and path.lower().endswith('.csv'):
+            writer = csv.DictWriter(out, fieldnames=PLAN_FIELDS + (ESTIMATE_FIELDS if estimates is not None else []))
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                out.write(json.dumps(row) + "\n")
+    finally:
+        if path:
+            out.close()
+    logging.info(f"Dry run: {len(changes)} proposed profile changes" + (f" written to {path}" if path else ""))
+
+def read_plan(path: str) -> List[ProfileChange]:
+    with open(path, 'r', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return [ProfileChange(int(row['item_id']), row['title'], int(row['current_profile_id']),
+                          int(row['proposed_profile_id']), row.get('rule') or None) for row in rows]
+
+# Queue a saved plan exactly as reviewed. Items whose profile changed since the plan
+# was made (or that no longer exist) are left alone; returns how many were skipped.
+def queue_plan(editor: BulkEditor, changes: List[ProfileChange], current_profiles: Dict[int, int]) -> int:
+    stale = 0
+    for change in changes:
+        current = current_profiles.get(change.item_id)
+        if current != change.old_profile_id:
+            logging.warning(f"Skipping '{change.title}' (ID: {change.item_id}): profile is {current}, "
+                            f"plan expected {change.old_profile_id}")
+            stale += 1
+            continue
+        editor.queue(change)
+    return stale
+
+# Items whose proposed profile differs between two plans, e.g. dry runs
+# (or --replay runs) of two config versions. An item in only one plan is left
+# unchanged by the other. Returns (item id, title, change in a, change in b).
+def diff_plans(a: List[ProfileChange], b: List[ProfileChange]) -> List[Tuple[int, str, Optional[ProfileChange], Optional[ProfileChange]]]:
+    changes_a = {change.item_id: change for change in a}
+    changes_b = {change.item_id: change for change in b}
+    differences = []
+    for item_id in sorted(changes_a.keys() | changes_b.keys()):
+        change_a, change_b = changes_a.get(item_id), changes_b.get(item_id)
+        if change_a and change_b and change_a.new_profile_id == change_b.new_profile_id:
+            continue
+        differences.append((item_id, (change_a or change_b).title, change_a, change_b))
+    return differences
+
+def _describe(change: Optional[ProfileChange]) -> str:
+    if change is None:
+        return "unchanged"
+    return f"{change.old_profile_id} -> {change.new_profile_id} ({change.rule or 'default'})"
+
+# Command line entry point: `python -m downgraderr_core plan-diff A B`.
+def run(argv: Optional[List[str]] = None, prog: Optional[str] = None):
+    parser = argparse.ArgumentParser(prog=prog, description="Show the items two plans (--plan, --replay --plan) decide differently.")
+    parser.add_argument('a', metavar='PLAN_A', help="first plan (.jsonl or .csv)")
+    parser.add_argument('b', metavar='PLAN_B', help="second plan (.jsonl or .csv)")
+    parser.add_argument('--json', action='store_true', help="print the differences as JSONL")
+    args = parser.parse_args(argv)
+    differences = diff_plans(read_plan(args.a), read_plan(args.b))
+    for item_id, title, change_a, change_b in differences:
+        if args.json:
+            print(json.dumps({'item_id': item_id, 'title': title,
+                              'a': change_a and {'proposed_profile_id': change_a.new_profile_id, 'rule': change_a.rule},
+                              'b': change_b and {'proposed_profile_id': change_b.new_profile_id, 'rule': change_b.rule}}))
+        else:
+            print(f"{item_id}\t{title}\t{_describe(change_a)}\t{_describe(change_b)}")
+    print(f"{len(differences)} items decided differently", file=sys.stderr)
+    if differences:
+        sys.exit(1)
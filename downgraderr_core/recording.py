@@ -0,0 +1,51 @@
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+FORMAT_VERSION = 1
+
+# Everything a sweep decided from, captured during a live run (--record) so the
+# decisions can be re-run offline (--replay): the quality profiles, the library
+# listing (only the fields in `fields`) and the TMDB rating each item was decided
+# with. Stored as gzipped JSON.
+class Recording:
+    def __init__(self, app: str, fields: Iterable[str], profiles: Optional[List[Dict[str, Any]]] = None,
+                 items: Optional[List[Dict[str, Any]]] = None, ratings: Optional[Dict[int, float]] = None,
+                 recorded: Optional[str] = None):
+        self.app = app
+        self.fields = tuple(fields)
+        self.profiles = profiles or []
+        self.items = items or []
+        self.ratings = ratings or {}
+        self.recorded = recorded
+
+    def add_item(self, item: Dict[str, Any]):
+        self.items.append({field: item[field] for field in self.fields if field in item})
+
+    def save(self, path: str):
+        self.recorded = datetime.now().isoformat(timespec="seconds")
+        data = {"version": FORMAT_VERSION, "app": self.app, "recorded": self.recorded, "fields": self.fields,
+                "profiles": self.profiles, "items": self.items,
+                "ratings": {str(item_id): rating for item_id, rating in self.ratings.items()}}
+        temporary = f"{path}.tmp"
+        with gzip.open(temporary, 'wt', compresslevel=6) as file:
+            json.dump(data, file, separators=(",", ":"))
+        os.replace(temporary, path)
+        logging.info(f"Recorded {len(self.items)} items, {len(self.ratings)} ratings and {len(self.profiles)} "
+                     f"quality profiles to {path} ({os.path.getsize(path) / 1024:.0f} KiB)")
+
+    @classmethod
+    def load(cls, path: str, app: str) -> "Recording":
+        with gzip.open(path, 'rt') as file:
+            data = json.load(file)
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported recording version {data.get('version')}")
+        if data.get("app") != app:
+            raise ValueError(f"{path} was recorded from {data.get('app')}, not {app}")
+        recording = cls(app, data["fields"], data["profiles"], data["items"],
+                        {int(item_id): rating for item_id, rating in data["ratings"].items()}, data.get("recorded"))
+        logging.info(f"Replaying {len(recording.items)} items recorded {recording.recorded} from {path}")
+        return recording
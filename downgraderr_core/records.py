@@ -0,0 +1,31 @@
+from typing import Iterable, Optional
+
+# Compact per-item record built from one element of a /series or /movie listing.
+# Holds only what rating, rules and updates need, so the raw JSON (images,
+# seasons, alternate titles, ...) can be dropped as soon as it has been read.
+class ItemRecord:
+    __slots__ = ('id', 'title', 'status', 'genres', 'episodes', 'year', 'aired', 'profile_id',
+                 'tmdb_id', 'tvdb_id', 'imdb_id', 'rating', 'files', 'size_on_disk')
+
+    def __init__(self, id: int, title: str, status: str, genres: Iterable[str], profile_id: int,
+                 episodes: int = 0, year: int = 0, aired: Optional[str] = None,
+                 tmdb_id: int = 0, tvdb_id: int = 0, imdb_id: Optional[str] = None, rating: float = 0,
+                 files: int = 0, size_on_disk: int = 0):
+        self.id = id
+        self.title = title
+        self.status = status.lower()
+        self.genres = frozenset(genres)
+        self.episodes = episodes
+        self.year = year
+        self.aired = aired
+        self.profile_id = profile_id
+        self.tmdb_id = tmdb_id
+        self.tvdb_id = tvdb_id
+        self.imdb_id = imdb_id
+        self.rating = rating
+        self.files = files
+        self.size_on_disk = size_on_disk
+
+    # Decision inputs that come from the *arr app itself, for incremental-run fingerprints.
+    def inputs(self) -> tuple:
+        return (self.status, tuple(sorted(self.genres)), self.episodes, self.aired, self.size_on_disk)
@@ -0,0 +1,117 @@
+from numbers import Real
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from downgraderr_core.records import ItemRecord
+
+# Profiles in the order they are tried; the first rule that matches wins.
+PROFILE_ORDER = ['4k', '1080p', '720p']
+DEFAULT_PROFILE = '1080p'
+
+# CONDITIONS flag -> (config key template, what the check compares)
+CHECKS = {
+    'USE_RATING': 'RATING_THRESHOLD_{}',
+    'USE_EPISODES': 'EPISODE_THRESHOLD_{}',
+    'USE_YEAR': 'YEAR_THRESHOLD_{}',
+    'USE_GENRES': 'PROFILE_{}_GENRES',
+    'USE_SIZE': 'SIZE_THRESHOLD_{}',
+    'USE_CONTINUING': None,
+}
+
+class RuleError(ValueError):
+    pass
+
+# One profile's compiled conditions: a tuple of predicates that must all hold.
+class Rule:
+    __slots__ = ('profile', 'checks', 'description')
+
+    def __init__(self, profile: str, checks: List[Tuple[Callable[[ItemRecord], bool], str]]):
+        self.profile = profile
+        self.checks = tuple(check for check, _ in checks)
+        self.description = f"{profile}: " + " and ".join(text for _, text in checks)
+
+    def matches(self, record: ItemRecord) -> bool:
+        for check in self.checks:
+            if not check(record):
+                return False
+        return True
+
+class RuleSet:
+    def __init__(self, rules: List[Rule], default_profile: str = DEFAULT_PROFILE):
+        self.rules = tuple(rules)
+        self.default_profile = default_profile
+
+    # Return the chosen profile name and the rule that matched (None for the default).
+    def decide(self, record: ItemRecord) -> Tuple[str, Optional[Rule]]:
+        for rule in self.rules:
+            if rule.matches(record):
+                return rule.profile, rule
+        return self.default_profile, None
+
+def _threshold(config: Dict[str, Any], key: str, errors: List[str]) -> Optional[float]:
+    value = config.get(key)
+    if isinstance(value, bool) or not isinstance(value, Real):
+        errors.append(f"{key} must be a number, got {value!r}")
+        return None
+    return value
+
+def _genres(config: Dict[str, Any], key: str, errors: List[str]) -> Optional[FrozenSet[str]]:
+    value = config.get(key)
+    if not isinstance(value, list) or not all(isinstance(genre, str) for genre in value):
+        errors.append(f"{key} must be a list of genre names, got {value!r}")
+        return None
+    return frozenset(value)
+
+def _compile_check(flag: str, key: Optional[str], config: Dict[str, Any], errors: List[str]):
+    if flag == 'USE_RATING':
+        threshold = _threshold(config, key, errors)
+        return (lambda record: record.rating >= threshold), f"rating >= {threshold}"
+    if flag == 'USE_EPISODES':
+        threshold = _threshold(config, key, errors)
+        return (lambda record: record.episodes < threshold), f"episodes < {threshold}"
+    if flag == 'USE_YEAR':
+        threshold = _threshold(config, key, errors)
+        return (lambda record: record.year >= threshold), f"year >= {threshold}"
+    if flag == 'USE_SIZE':
+        # In GB, like the sizes the *arr UI shows
+        threshold = _threshold(config, key, errors)
+        limit = (threshold or 0) * 1024 ** 3
+        return (lambda record: record.size_on_disk < limit), f"size < {threshold} GB"
+    if flag == 'USE_GENRES':
+        genres = _genres(config, key, errors)
+        return (lambda record: not genres.isdisjoint(record.genres)), f"genres in {sorted(genres or ())}"
+    return (lambda record: record.status == 'continuing'), "status == continuing"
+
+# Validate CONDITIONS and the thresholds it refers to, and compile them into a RuleSet.
+# All problems are reported at once, before any request is made.
+def compile_rules(config: Dict[str, Any]) -> RuleSet:
+    conditions = config.get('CONDITIONS', {})
+    if not isinstance(conditions, dict):
+        raise RuleError(f"CONDITIONS must be an object, got {conditions!r}")
+
+    errors = []
+    for profile in conditions:
+        if profile not in PROFILE_ORDER:
+            errors.append(f"CONDITIONS has unknown profile '{profile}' (expected one of {', '.join(PROFILE_ORDER)})")
+
+    rules = []
+    for profile in PROFILE_ORDER:
+        flags = conditions.get(profile, {})
+        if not isinstance(flags, dict):
+            errors.append(f"CONDITIONS.{profile} must be an object, got {flags!r}")
+            continue
+        checks = []
+        for flag, enabled in flags.items():
+            if flag not in CHECKS:
+                errors.append(f"CONDITIONS.{profile} has unknown flag '{flag}'")
+            elif not isinstance(enabled, bool):
+                errors.append(f"CONDITIONS.{profile}.{flag} must be true or false, got {enabled!r}")
+            elif enabled:
+                key = CHECKS[flag] and CHECKS[flag].format(profile.upper())
+                checks.append(_compile_check(flag, key, config, errors))
+        # A profile without any enabled condition never matches.
+        if checks:
+            rules.append(Rule(profile, checks))
+
+    if errors:
+        raise RuleError("Invalid rule configuration:\n  " + "\n  ".join(errors))
+    return RuleSet(rules)
@@ -0,0 +1,302 @@
+import asyncio
+import codecs
+import json
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+from downgraderr_core.metrics import Metrics, endpoint_path
+
+# Defaults per host group. RATE is requests per second (0 disables the bucket),
+# BURST is how many requests may go out back to back after an idle period.
+DEFAULT_RATE_LIMITS = {
+    "arr": {"CONCURRENCY": 8, "RATE": 0, "BURST": 0},
+    "tmdb": {"CONCURRENCY": 16, "RATE": 40, "BURST": 40},
+}
+DEFAULT_ITEM_CONCURRENCY = 32
+
+# Idle keep-alive connections are reused for this long; DNS answers are cached as long.
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+DEFAULT_DNS_CACHE_TTL = 300
+
+# Statuses worth retrying: throttling and transient server errors.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Token bucket refilled continuously at `rate` tokens per second.
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Concurrency cap, request rate and shared back-off window for one host group.
+class HostLimiter:
+    def __init__(self, name: str, concurrency: int, rate: float, burst: float):
+        self.name = name
+        self.concurrency = max(concurrency, 1)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.bucket = TokenBucket(rate, burst or rate)
+        self.blocked_until = 0.0
+        self.throttled = 0
+
+    # A 429 pauses the whole group, not just the request that got it.
+    def back_off(self, seconds: float):
+        self.throttled += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            while (delay := self.blocked_until - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            await self.bucket.acquire()
+        except BaseException:
+            self.semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+# Seconds to wait according to a Retry-After header (delta-seconds or HTTP-date).
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    # HTTP-date form; rare, so the email package is only imported when needed
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+# Decode a JSON array from a byte stream one element at a time, so a listing of
+# tens of thousands of items never has to be held (or parsed) as a whole.
+async def iter_json_array(content, chunk_size: int = 64 * 1024) -> AsyncIterator[Any]:
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    eof = False
+    chunks = content.iter_chunked(chunk_size)
+    while not eof:
+        try:
+            buffer += text.decode(await chunks.__anext__())
+        except StopAsyncIteration:
+            buffer += text.decode(b"", final=True)
+            eof = True
+        pos = 0
+        while True:
+            while pos < len(buffer) and (buffer[pos] in _WHITESPACE or (started and buffer[pos] == ",")):
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"Expected a JSON array, got {buffer[pos:pos + 20]!r}")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                element, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break
+            # A bare number is only complete once a delimiter follows it ("2" of "2.5").
+            if not isinstance(element, (dict, list, str)):
+                if end == len(buffer) and not eof or end < len(buffer) and buffer[end] not in _WHITESPACE + ",]":
+                    break
+            yield element
+            pos = end
+        buffer = buffer[pos:]
+    raise ValueError("Truncated JSON array")
+
+# Routes every HTTP call through the limiter of the host group it belongs to and
+# retries throttled or failed requests with exponential backoff and full jitter.
+class Scheduler:
+    def __init__(self, rate_limits: Dict[str, Dict[str, float]], base_urls: Dict[str, str],
+                 max_retries: int = 3, retry_delay: float = 2, max_retry_delay: float = 60,
+                 item_concurrency: int = DEFAULT_ITEM_CONCURRENCY, keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+                 dns_cache_ttl: int = DEFAULT_DNS_CACHE_TTL):
+        self.limiters = {}
+        for name, defaults in DEFAULT_RATE_LIMITS.items():
+            limits = {**defaults, **rate_limits.get(name, {})}
+            self.limiters[name] = HostLimiter(name, limits["CONCURRENCY"], limits["RATE"], limits["BURST"])
+        # Longest prefix first so an arr and TMDB mock on the same host still split correctly.
+        self.base_urls = sorted(base_urls.items(), key=lambda entry: len(entry[0]), reverse=True)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.item_concurrency = item_concurrency
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.retries = 0
+        # Request latency per host group and responses per endpoint, plus the
+        # phases the scripts time (TMDB lookup, decision, update)
+        self.metrics = Metrics()
+        # When the first request went out, for the cold start budget
+        self.first_request: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], base_urls: Dict[str, str]) -> "Scheduler":
+        return cls(config.get("RATE_LIMITS", {}), base_urls,
+                   max_retries=config.get("MAX_RETRIES", 3),
+                   retry_delay=config.get("RETRY_DELAY", 2),
+                   max_retry_delay=config.get("MAX_RETRY_DELAY", 60),
+                   item_concurrency=config.get("ITEM_CONCURRENCY", DEFAULT_ITEM_CONCURRENCY),
+                   keepalive_timeout=config.get("KEEPALIVE_TIMEOUT", DEFAULT_KEEPALIVE_TIMEOUT),
+                   dns_cache_ttl=config.get("DNS_CACHE_TTL", DEFAULT_DNS_CACHE_TTL))
+
+    # HTTP session whose connection pool matches the limiters: never more connections
+    # than requests allowed in flight, kept alive between requests (and sweeps, in a
+    # long-running process) so TLS handshakes and DNS lookups are not repeated. One
+    # connection more for a listing being streamed, which holds its connection but
+    # not its limiter slot.
+    def session(self):
+        import aiohttp
+        connector = aiohttp.TCPConnector(limit=sum(limiter.concurrency for limiter in self.limiters.values()) + 1,
+                                         limit_per_host=max(limiter.concurrency for limiter in self.limiters.values()) + 1,
+                                         keepalive_timeout=self.keepalive_timeout,
+                                         ttl_dns_cache=self.dns_cache_ttl)
+        return aiohttp.ClientSession(connector=connector)
+
+    # Use another scheduler's limiter for a host group, so several instances in one
+    # process stay within one rate limit for a service they all call (TMDB).
+    def share_limiter(self, name: str, limiter: HostLimiter):
+        self.limiters[name] = limiter
+
+    def limiter_for(self, url: str) -> HostLimiter:
+        for base_url, name in self.base_urls:
+            if url.startswith(base_url):
+                return self.limiters[name]
+        return self.limiters["arr"]
+
+    # "GET /series/{id}": the URL without its base URL and query, ids replaced.
+    def endpoint(self, method: str, url: str) -> str:
+        for base_url, _ in self.base_urls:
+            if url.startswith(base_url):
+                return f"{method} {endpoint_path(urlsplit(url[len(base_url):]).path)}"
+        return f"{method} {endpoint_path(urlsplit(url).path)}"
+
+    def backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_retry_delay, self.retry_delay * 2 ** attempt))
+
+    # The delay a retryable response asks for in Retry-After, capped at
+    # max_retry_delay so a huge value or far-off date cannot stall a sweep;
+    # the backoff delay when it sends none.
+    def response_delay(self, response, attempt: int) -> float:
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is None:
+            return self.backoff_delay(attempt)
+        return min(retry_after, self.max_retry_delay)
+
+    async def request(self, session, method: str, url: str, **kwargs) -> Any:
+        # Imported here rather than at the top so that importing the scheduler stays cheap
+        import aiohttp
+        limiter = self.limiter_for(url)
+        endpoint = self.endpoint(method, url)
+        latency = self.metrics.histogram(f"request_{limiter.name}")
+        if self.first_request is None:
+            self.first_request = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            async with limiter:
+                started = time.perf_counter()
+                status = "error"
+                try:
+                    async with session.request(method, url, **kwargs) as response:
+                        status = str(response.status)
+                        if response.status not in RETRY_STATUSES:
+                            response.raise_for_status()
+                            return await response.json(content_type=None)
+                        error = f"HTTP {response.status}"
+                        delay = self.response_delay(response, attempt)
+                        if response.status == 429:
+                            limiter.back_off(delay)
+                except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                    error = str(e) or type(e).__name__
+                    delay = self.backoff_delay(attempt)
+                finally:
+                    latency.observe(time.perf_counter() - started)
+                    self.metrics.count_request(limiter.name, endpoint, status)
+            if attempt == self.max_retries:
+                break
+            self.retries += 1
+            logging.warning(f"{method} {url} failed ({error}), retrying in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
+        raise Exception(f"Failed to {method} {url} after {self.max_retries} retries ({error}).")
+
+    # GET a JSON array and yield its elements as they arrive. Connection errors and
+    # retryable statuses are retried until the first element has been received.
+    # The limiter slot is only held until the response headers are in: the body is
+    # consumed as fast as the pipeline takes items, and requests the pipeline makes
+    # to the same host meanwhile (bulk editor PUTs) must not wait for the listing
+    # to end, or a CONCURRENCY of 1 would deadlock.
+    async def stream(self, session, url: str, **kwargs) -> AsyncIterator[Any]:
+        import aiohttp
+        limiter = self.limiter_for(url)
+        endpoint = self.endpoint("GET", url)
+        latency = self.metrics.histogram(f"request_{limiter.name}")
+        if self.first_request is None:
+            self.first_request = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            received = False
+            started = time.perf_counter()
+            status = "error"
+            try:
+                async with limiter:
+                    started = time.perf_counter()
+                    response = await session.get(url, **kwargs)
+                async with response:
+                    status = str(response.status)
+                    if response.status not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        async for element in iter_json_array(response.content):
+                            received = True
+                            yield element
+                        return
+                    error = f"HTTP {response.status}"
+                    delay = self.response_delay(response, attempt)
+                    if response.status == 429:
+                        limiter.back_off(delay)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                if received:
+                    raise
+                error = str(e) or type(e).__name__
+                delay = self.backoff_delay(attempt)
+            finally:
+                # The whole transfer for a streamed listing
+                latency.observe(time.perf_counter() - started)
+                self.metrics.count_request(limiter.name, endpoint, status)
+            if attempt == self.max_retries:
+                break
+            self.retries += 1
+            logging.warning(f"GET {url} failed ({error}), retrying in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
+        raise Exception(f"Failed to GET {url} after {self.max_retries} retries ({error}).")
+
+    def report(self):
+        throttled = ", ".join(f"{name}: {limiter.throttled}" for name, limiter in self.limiters.items())
+        logging.info(f"Scheduler: {self.retries} retries, 429 responses per host ({throttled})")
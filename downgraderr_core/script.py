@@ -0,0 +1,459 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from downgraderr_core.arr import ArrClient, api_url, get_profile_id, strip_year_from_title
+from downgraderr_core.audit import AuditLog
+from downgraderr_core.cache import MetadataCache
+from downgraderr_core.daemon import run_daemon
+from downgraderr_core.editor import ProfileChange
+from downgraderr_core.events import TRIGGER_EVENTS, event_from_env, serve_webhooks
+from downgraderr_core.metrics import build_report, write_json_report, write_prometheus
+from downgraderr_core.pipeline import Pipeline
+from downgraderr_core.recording import Recording
+from downgraderr_core.records import ItemRecord
+from downgraderr_core.rules import compile_rules
+from downgraderr_core.scheduler import Scheduler
+from downgraderr_core.snapshot import ItemSnapshot
+from downgraderr_core.startup import process_started, report_startup
+from downgraderr_core.state import StateStore, config_version
+from downgraderr_core.tmdb import RatingRefresher, cached_rating, get_rating
+
+def read_config(filename: str) -> Dict[str, Any]:
+    with open(filename, 'r') as file:
+        return json.load(file)
+
+# Everything a Sonarr, Radarr or Lidarr script does: configuration, storage, the
+# fetch -> enrich -> decide -> apply sweep, single-item updates for events, the
+# daemon and webhook modes, record/replay and the command line. A script subclasses
+# it, names its app and endpoints in the class attributes and overrides the hooks:
+# record() (listing entry -> ItemRecord; abstract, so a script without it fails
+# when created), rating()/known_rating() (where the rating comes from; TMDB by
+# default), decide() (rating and inputs -> profile) and migrate() (legacy cache
+# imports). One object per instance; importing a script reads, opens and prints
+# nothing, run() configures it first.
+class ArrScript(ABC):
+    # "sonarr": the app, for the API version, audit log, events and recordings
+    app = ""
+    # Display name, for help texts
+    title = ""
+    # /{kind} listing, /{kind}/{id} and /{kind}/editor endpoints; the editor's ids field
+    kind = ""
+    ids_field = ""
+    # What an item is called in log lines and help texts
+    noun = ""
+    plural = ""
+    # Config key of the app's base URL, and the default config file
+    url_key = ""
+    default_config = ""
+    # Listing fields record() reads, the only ones kept by --record
+    record_fields: Tuple[str, ...] = ()
+    # GET /{kind}/{id} calls the per-item code made for each item before the bulk listing
+    requests_per_item = 0
+    # TMDB media type the rating is looked up as ("tv", "movie"); None when rating() is overridden
+    media_type: Optional[str] = None
+
+    def __init__(self):
+        self.config: Dict[str, Any] = {}
+        self.cache: Optional[MetadataCache] = None
+        self.cache_shared = False
+        self.state: Optional[StateStore] = None
+        self.audit: Optional[AuditLog] = None
+        # Refetches expired ratings in the background; set by main() while the session is open
+        self.refresher: Optional[RatingRefresher] = None
+        # The recording being captured (--record) or replayed (--replay), if any
+        self.recording: Optional[Recording] = None
+        self.replaying: Optional[Recording] = None
+        # Report of the last sweep, kept for a multi-instance run's combined report
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    # Read configuration from file (or take an already merged config, for one of
+    # several instances in a multi-instance run) and set up the scheduler and client.
+    def configure(self, source: Union[str, Dict[str, Any], None] = None):
+        config = self.config = source if isinstance(source, dict) else read_config(source or self.default_config)
+        self.configure_rules()
+
+        self.api_key = config.get('API_KEY')
+        self.tmdb_api_key = config.get('TMDB_API_KEY')
+        self.tmdb_api_url = config.get('TMDB_API_URL', "https://api.themoviedb.org/3")
+
+        # Where each sweep's JSON run report and Prometheus textfile go (none by default)
+        self.report_path = config.get('RUN_REPORT')
+        self.prometheus_path = config.get('PROMETHEUS_TEXTFILE')
+
+        # Per-host concurrency caps, rate limits and retry settings
+        # (RATE_LIMITS, ITEM_CONCURRENCY, MAX_RETRIES, RETRY_DELAY in the config)
+        base_urls = {api_url(self.app, config.get(self.url_key)): "arr"}
+        if self.media_type:
+            base_urls[self.tmdb_api_url] = "tmdb"
+        self.scheduler = Scheduler.from_config(config, base_urls)
+        # Every request to the app goes through this client, and so through the scheduler
+        self.client = ArrClient(self.app, self.scheduler, config.get(self.url_key), self.api_key)
+
+    # Validate and compile CONDITIONS once; bad config fails here, before any request.
+    def configure_rules(self):
+        self.rules = compile_rules(self.config)
+        for rule in self.rules.rules:
+            logging.debug(f"Rule: {rule.description}")
+
+    # Open the rating cache, incremental state and profile change audit log. A
+    # multi-instance run passes its shared cache and the instance name, which keeps
+    # this instance's state and audit entries apart from other instances of the same
+    # app with overlapping ids. All apps share CACHE_DIR/metadata.db.
+    def open_storage(self, shared_cache: Optional[MetadataCache] = None, instance: Optional[str] = None):
+        self.cache_shared = shared_cache is not None
+        self.cache = shared_cache if self.cache_shared else MetadataCache.from_config(self.config)
+
+        # Per-item fingerprints of the last decision's inputs, for incremental runs
+        self.state = StateStore(self.cache, f"{self.app}:{instance}" if instance else self.app, config_version(self.config))
+
+        # Every profile change with its rule and run, and flapping detection (FLAP_WINDOW_DAYS)
+        self.audit = AuditLog.from_config(self.cache, self.app, instance or "", self.config)
+        if not self.cache_shared:
+            self.migrate()
+
+    # One-shot imports of a script's legacy cache files; a shared cache is migrated by its owner.
+    def migrate(self):
+        pass
+
+    # Close what open_storage() opened; a shared cache is left to its owner.
+    def close_storage(self):
+        self.audit.flush()
+        if not self.cache_shared:
+            self.cache.close()
+
+    # Build the compact record for an item from its listing entry.
+    @abstractmethod
+    def record(self, item: Dict[str, Any]) -> ItemRecord:
+        ...
+
+    # The profile for a rated item and a description of the rule that chose it.
+    def decide(self, item: ItemRecord, profile_ids: Dict[str, int]) -> Tuple[int, str]:
+        profile_name, rule = self.rules.decide(item)
+        return profile_ids[profile_name], rule.description if rule else 'default'
+
+    # The configured 4k, 1080p and 720p profile names.
+    def profile_names(self) -> Dict[str, str]:
+        return {
+            '4k': self.config.get('PROFILE_4K_NAME'),
+            '1080p': self.config.get('PROFILE_1080p_NAME'),
+            '720p': self.config.get('PROFILE_720p_NAME'),
+        }
+
+    # IDs of the three configured profiles.
+    def get_profile_ids(self, profiles: List[Dict[str, Any]]) -> Dict[str, int]:
+        return {tier: get_profile_id(name, profiles) for tier, name in self.profile_names().items()}
+
+    async def get_profiles(self, session) -> List[Dict[str, Any]]:
+        if self.replaying:
+            return self.replaying.profiles
+        return await self.client.get_profiles(session)
+
+    # Stream the whole library as compact records.
+    def get_items(self, session, snapshot: ItemSnapshot) -> AsyncIterator[ItemRecord]:
+        if self.replaying:
+            return snapshot.replay(self.replaying.items, self.record)
+        return self.client.stream(session, snapshot, self.kind, self.record)
+
+    # The rating an item is decided with: TMDB's, using the cache when it is recent.
+    async def rating(self, session, item: ItemRecord) -> float:
+        if self.replaying:
+            return self.replaying.ratings.get(item.id, 0)
+        title, year = strip_year_from_title(item.title)
+        with self.scheduler.metrics.timer("tmdb_lookup"):
+            rating = await get_rating(session, self.client.fetch, self.cache, self.media_type, item, title, year,
+                                      self.tmdb_api_url, self.tmdb_api_key, self.refresher)
+        if self.recording:
+            self.recording.ratings[item.id] = rating
+        return rating
+
+    # The rating known without any request, for the incremental check; None if there is none yet.
+    async def known_rating(self, item: ItemRecord) -> Optional[float]:
+        title, year = strip_year_from_title(item.title)
+        return await cached_rating(self.cache, self.media_type, item, title, year, self.refresher)
+
+    # Enrich stage: drop items whose inputs, known rating and profile are the same
+    # as last run, and attach the rating to the rest.
+    async def rate(self, session, item: ItemRecord, full: bool = False) -> Optional[ItemRecord]:
+        if not full:
+            rating = await self.known_rating(item)
+            if rating is not None and self.state.unchanged(item.id, self.state.fingerprint(*item.inputs(), rating, item.profile_id)):
+                return None
+        item.rating = await self.rating(session, item)
+        return item
+
+    # Decide stage: pick the profile for a rated item.
+    def decide_profile(self, item: ItemRecord, profile_ids: Dict[str, int]) -> ProfileChange:
+        with self.scheduler.metrics.timer("decide"):
+            profile_id, rule = self.decide(item, profile_ids)
+            change = ProfileChange(item.id, item.title, item.profile_id, profile_id, rule)
+            if self.audit.flapping(change):
+                # Evaluated, but left out of the state, so the item is decided again on the next run
+                self.state.evaluated += 1
+                return ProfileChange(item.id, item.title, item.profile_id, item.profile_id, rule, suppressed=True)
+            self.state.record(item.id, self.state.fingerprint(*item.inputs(), item.rating, profile_id))
+            return change
+
+    def editor(self):
+        return self.client.editor(self.kind, self.ids_field, self.config.get('EDITOR_CHUNK_SIZE', 200))
+
+    # Fetch, rate, decide and apply just the given items, e.g. in response to an event.
+    # The rating cache, state and HTTP session are the caller's, so repeated calls stay warm.
+    async def update(self, session, item_ids: List[int], profile_ids: Dict[str, int], full: bool = False) -> List[ProfileChange]:
+        editor = self.editor()
+
+        await self.audit.start_run()
+
+        async def fetch_and_rate(item_id):
+            return await self.rate(session, self.record(await self.client.get_item(session, self.kind, item_id)), full)
+
+        for item in await asyncio.gather(*(fetch_and_rate(item_id) for item_id in item_ids)):
+            if item is None:
+                continue
+            change = self.decide_profile(item, profile_ids)
+            if editor.queue(change):
+                logging.info(f"Updating {self.noun} '{change.title}' (ID: {change.item_id}) to profile ID {change.new_profile_id} ({change.rule})")
+        applied = await editor.apply(session)
+        self.audit.record(applied)
+        self.audit.flush()
+        self.state.forget(change.item_id for change in editor.failed)
+        self.cache.commit()
+        logging.info(f"Evaluated {len(item_ids)} {self.plural}, {len(applied)} profile changes applied")
+        return applied
+
+    # Build the sweep's run report and write it as JSON (RUN_REPORT, --report) and as a
+    # Prometheus textfile (PROMETHEUS_TEXTFILE, --prometheus), if configured.
+    def write_reports(self, summary: Dict[str, int]):
+        self.last_report = build_report(self.app, self.audit.instance, self.audit.run_id, self.scheduler.metrics,
+                                        self.scheduler, self.cache, summary)
+        if self.report_path:
+            write_json_report(self.report_path, self.last_report)
+        if self.prometheus_path:
+            write_prometheus(self.prometheus_path, [self.last_report])
+
+    # One pass over the whole library: stream, rate, decide and apply (or plan) every item.
+    async def sweep(self, session, profiles: List[Dict[str, Any]], profile_ids: Dict[str, int], full: bool = False,
+                    dry_run: bool = False, plan_path: str = None, apply_path: str = None, free: Optional[int] = None) -> Dict[str, int]:
+        state, audit, cache, scheduler = self.state, self.audit, self.cache, self.scheduler
+        # Only the mode that is running needs the plan module
+        if dry_run or apply_path:
+            from downgraderr_core.plan import queue_plan, read_plan, write_plan
+        # Summaries are per sweep, which matters once the daemon runs more than one
+        state.skipped = state.evaluated = 0
+        await audit.start_run(read_only=dry_run)
+        scheduler.metrics.reset()
+        # A shared cache is summarised once for all instances by its owner
+        if not self.cache_shared:
+            cache.stats.clear()
+            cache.metrics.reset()
+
+        snapshot = ItemSnapshot(self.kind, self.requests_per_item, self.recording)
+        editor = self.editor()
+
+        if apply_path:
+            # Apply a reviewed plan as-is, without re-rating or re-deciding anything
+            current_profiles = {item.id: item.profile_id async for item in self.get_items(session, snapshot)}
+            queue_plan(editor, read_plan(apply_path), current_profiles)
+        else:
+            state.read_only = dry_run
+
+            async def enrich(item):
+                return await self.rate(session, item, full)
+
+            async def decide(item):
+                return self.decide_profile(item, profile_ids)
+
+            async def apply(change):
+                if not editor.queue(change):
+                    if not change.suppressed:
+                        logging.debug("No profile change needed for %s %s", self.noun, change.item_id)
+                    return
+                # Per-item lines are DEBUG with lazy arguments: nothing is formatted unless they are shown
+                logging.debug("Updating %s '%s' (ID: %s) to profile ID %s (%s)", self.noun, change.title, change.item_id,
+                              change.new_profile_id, change.rule)
+                if not dry_run:
+                    audit.record(await editor.apply_full_chunks(session))
+
+            pipeline = Pipeline(self.config.get('QUEUE_SIZE', 256))
+            await pipeline.run(self.get_items(session, snapshot), [
+                ("enrich", enrich, scheduler.item_concurrency),
+                ("decide", decide, 1),
+                ("apply", apply, 1),
+            ])
+            pipeline.report()
+
+        if dry_run:
+            changes = editor.changes()
+            estimates = None
+            if free:
+                # Space budget: only the rule-driven downgrades needed to free `free` bytes, largest first
+                from downgraderr_core.budget import plan_budget, report_budget, size_ratios
+                ratios = size_ratios(profiles, profile_ids, self.config.get('PROFILE_SIZE_RATIOS', {}))
+                selected, available = plan_budget(changes, dict(zip(snapshot.table.ids, snapshot.table.sizes)), ratios, free)
+                report_budget(selected, available, free)
+                changes = [downgrade.change for downgrade in selected]
+                estimates = {downgrade.change.item_id: (downgrade.size, downgrade.reclaimed) for downgrade in selected}
+            write_plan(plan_path, changes, {profile['id']: profile['name'] for profile in profiles}, estimates)
+        else:
+            audit.record(await editor.apply(session))
+            audit.flush()
+            # Failed items are re-evaluated on the next run
+            state.forget(change.item_id for change in editor.failed)
+            editor.report()
+            audit.report()
+        snapshot.report()
+        state.report()
+        if not self.cache_shared and self.media_type:
+            cache.report()
+        scheduler.report()
+        # Counts for the run report and the combined summary of a multi-instance run
+        summary = {"items": snapshot.count, "evaluated": state.evaluated, "skipped": state.skipped,
+                   "changes": len(changes) if dry_run else editor.applied, "failed": len(editor.failed)}
+        self.write_reports(summary)
+        return summary
+
+    async def main(self, full: bool = False, dry_run: bool = False, plan_path: str = None, apply_path: str = None,
+                   item_ids: Optional[List[int]] = None, webhook: Optional[Tuple[str, int]] = None, daemon: bool = False,
+                   free: Optional[int] = None, record_path: Optional[str] = None) -> Optional[Dict[str, int]]:
+        # One pooled session for the whole process, however many sweeps and events it handles
+        async with self.scheduler.session() as session:
+            # Stale-while-revalidate: decide with an expired rating, refetch it in the background
+            refreshing = bool(self.media_type) and self.config.get('STALE_WHILE_REVALIDATE', True)
+            if refreshing:
+                self.refresher = RatingRefresher(session, self.client.fetch, self.cache, self.tmdb_api_url, self.tmdb_api_key,
+                                                 self.config.get('REFRESH_RATE', 4))
+                self.refresher.start()
+            try:
+                profiles = await self.get_profiles(session)
+                profile_ids = self.get_profile_ids(profiles)
+
+                if item_ids:
+                    await self.update(session, item_ids, profile_ids, full)
+                    return
+
+                services = []
+                if daemon:
+                    async def scheduled_sweep():
+                        await self.sweep(session, profiles, profile_ids, full)
+                        self.cache.commit()
+                    services.append(run_daemon(scheduled_sweep, self.config.get('DAEMON_INTERVAL', 3600)))
+                if webhook:
+                    async def handle(event_ids):
+                        await self.update(session, event_ids, profile_ids)
+                    services.append(serve_webhooks(self.app, handle, *webhook, self.config.get('WEBHOOK_DELAY', 5),
+                                                   self.config.get('WEBHOOK_TOKEN')))
+                if services:
+                    await asyncio.gather(*services)
+                    return
+
+                summary = await self.sweep(session, profiles, profile_ids, full, dry_run, plan_path, apply_path, free)
+                if self.recording:
+                    self.recording.profiles = profiles
+                    self.recording.save(record_path)
+                return summary
+            finally:
+                # Before the session closes: nothing may still be using it
+                if refreshing:
+                    await self.refresher.stop()
+                    self.refresher.report()
+
+    # Re-run the decisions of a recorded sweep: profiles, listing and ratings all come
+    # from the recording, so nothing is sent over the network and nothing is changed.
+    async def replay(self, plan_path: str = None, free: Optional[int] = None) -> Dict[str, int]:
+        profiles = self.replaying.profiles
+        return await self.sweep(None, profiles, self.get_profile_ids(profiles), full=True, dry_run=True,
+                                plan_path=plan_path, free=free)
+
+    # Command line entry point of the script, also used by `python -m downgraderr_core APP`.
+    def run(self, argv: Optional[List[str]] = None, prog: Optional[str] = None):
+        started = process_started()
+        recorded = "the listing, profiles and TMDB ratings" if self.media_type else "the listing and profiles"
+        sources = f"{self.title} and TMDB" if self.media_type else self.title
+        parser = argparse.ArgumentParser(prog=prog, description=f"Assign {self.title} quality profiles based on configurable conditions.")
+        parser.add_argument('--config', metavar='FILE', default=self.default_config, help=f"config file (default: {self.default_config})")
+        parser.add_argument('--full', action='store_true', help=f"re-evaluate every {self.noun}, not only those whose inputs changed")
+        parser.add_argument('--dry-run', action='store_true', help="decide profiles but change nothing; print the plan as JSONL")
+        parser.add_argument('--plan', metavar='FILE', help="dry run that writes the plan to FILE (.jsonl or .csv)")
+        parser.add_argument('--apply', metavar='FILE', help="apply a plan written by --plan without recomputing it")
+        parser.add_argument('--free', metavar='SIZE', help="dry run that plans the fewest rule-driven downgrades freeing SIZE (e.g. 4TB)")
+        parser.add_argument('--item', metavar='ID', type=int, action='append', help=f"evaluate and update only this {self.noun} id (repeatable)")
+        parser.add_argument('--daemon', action='store_true', help="keep running and re-evaluate every DAEMON_INTERVAL seconds or on SIGHUP")
+        parser.add_argument('--webhook', metavar='[HOST:]PORT', help=f"listen for {self.title} webhooks and update the {self.plural} they mention")
+        parser.add_argument('--record', metavar='FILE', help=f"sweep every {self.noun} and save {recorded} to FILE")
+        parser.add_argument('--replay', metavar='FILE', help=f"dry run that decides from a --record file instead of {sources}")
+        parser.add_argument('--verbose', '-v', action='store_true', help="also log every item's decision (DEBUG)")
+        parser.add_argument('--report', metavar='FILE', help="write a JSON run report with timings and request counts to FILE")
+        parser.add_argument('--prometheus', metavar='FILE', help="write the run's metrics to FILE for the node_exporter textfile collector")
+        args = parser.parse_args(argv)
+        if args.apply and (args.dry_run or args.plan or args.free):
+            parser.error("--apply cannot be combined with --dry-run, --plan or --free")
+        if (args.item or args.webhook or args.daemon) and (args.dry_run or args.plan or args.apply or args.free):
+            parser.error("--item, --webhook and --daemon cannot be combined with --dry-run, --plan, --apply or --free")
+        if args.record and (args.item or args.webhook or args.daemon or args.apply):
+            parser.error("--record cannot be combined with --item, --webhook, --daemon or --apply")
+        if args.replay and (args.item or args.webhook or args.daemon or args.apply or args.record):
+            parser.error("--replay cannot be combined with --item, --webhook, --daemon, --apply or --record")
+        free = None
+        if args.free:
+            from downgraderr_core.budget import parse_size
+            try:
+                free = parse_size(args.free)
+            except ValueError as e:
+                parser.error(str(e))
+        if args.item and (args.webhook or args.daemon):
+            parser.error("--item cannot be combined with --webhook or --daemon")
+        webhook = None
+        if args.webhook:
+            host, _, port = args.webhook.rpartition(':')
+            if not port.isdigit():
+                parser.error(f"invalid --webhook address '{args.webhook}'")
+            webhook = (host or '127.0.0.1', int(port))
+
+        # Configure logging
+        logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+        # Started by the app as a Custom Script (Settings > Connect): only the item in the event
+        event = event_from_env(self.app, os.environ)
+        if event and not args.item:
+            event_type, item_id = event
+            if event_type not in TRIGGER_EVENTS[self.app] or item_id is None:
+                logging.info(f"Nothing to do for {self.app} event {event_type}")
+                return
+            args.item = [item_id]
+        self.configure(args.config)
+        if args.report:
+            self.report_path = args.report
+        if args.prometheus:
+            self.prometheus_path = args.prometheus
+        replay_cache = None
+        if args.replay:
+            try:
+                self.replaying = Recording.load(args.replay, self.app)
+            except (OSError, ValueError) as e:
+                parser.error(str(e))
+            # Nothing from a replay is persisted: no ratings, state or audit entries
+            replay_cache = MetadataCache(':memory:')
+            self.open_storage(replay_cache)
+        else:
+            if args.record:
+                self.recording = Recording(self.app, self.record_fields)
+            self.open_storage()
+        try:
+            if self.replaying:
+                asyncio.run(self.replay(args.plan, free))
+            else:
+                asyncio.run(self.main(full=args.full or bool(args.record), dry_run=args.dry_run or bool(args.plan) or bool(free),
+                                      plan_path=args.plan, apply_path=args.apply, item_ids=args.item, webhook=webhook,
+                                      daemon=args.daemon, free=free, record_path=args.record))
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+        finally:
+            self.close_storage()
+            # Passed in as a shared cache, so close_storage() leaves it open
+            if replay_cache is not None:
+                replay_cache.close()
+        report_startup(started, self.scheduler.first_request, self.config.get('STARTUP_BUDGET_MS', 1000))
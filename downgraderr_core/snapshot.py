@@ -0,0 +1,45 @@
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional
+
+from downgraderr_core.records import ItemRecord
+from downgraderr_core.recording import Recording
+from downgraderr_core.table import LibraryTable
+
+# Per-run view of the items in a single bulk list call (/series, /movie). The
+# listing is streamed and each element turned into a compact ItemRecord right
+# away; nothing per item is fetched again, profile changes go through the bulk
+# editor endpoint.
+class ItemSnapshot:
+    def __init__(self, kind: str, requests_per_item: int, recording: Optional[Recording] = None):
+        self.kind = kind
+        # GET /{kind}/{id} calls the old per-item code made for each item; 0 when there never was any
+        self.requests_per_item = requests_per_item
+        self.count = 0
+        # Per-item statistics of the whole listing, collected in the same pass
+        self.table = LibraryTable()
+        # Listing elements are also captured here for --record
+        self.recording = recording
+
+    async def stream(self, scheduler, session, url: str, headers: Dict[str, str],
+                     to_record: Callable[[Dict[str, Any]], ItemRecord]) -> AsyncIterator[ItemRecord]:
+        async for item in scheduler.stream(session, url, headers=headers):
+            self.count += 1
+            if self.recording is not None:
+                self.recording.add_item(item)
+            record = to_record(item)
+            self.table.append(record)
+            yield record
+
+    # The same, from the listing elements of a recording (--replay).
+    async def replay(self, items: Iterable[Dict[str, Any]],
+                     to_record: Callable[[Dict[str, Any]], ItemRecord]) -> AsyncIterator[ItemRecord]:
+        for item in items:
+            self.count += 1
+            record = to_record(item)
+            self.table.append(record)
+            yield record
+
+    def report(self):
+        saved = f", {self.count * self.requests_per_item} HTTP requests saved" if self.requests_per_item else ""
+        logging.info(f"{self.kind} snapshot: {self.count} items from 1 bulk request{saved}")
+        self.table.report(self.kind)
@@ -0,0 +1,34 @@
+import logging
+import os
+import time
+from typing import Optional
+
+DEFAULT_STARTUP_BUDGET_MS = 1000
+
+# Fallback start time where /proc is not available: when this module was first imported.
+IMPORTED = time.monotonic()
+
+# Monotonic time at which this process started, so the measurement includes
+# interpreter start-up and imports, not just the time spent in main().
+def process_started() -> float:
+    try:
+        with open("/proc/self/stat") as file:
+            # Fields after the command name; starttime is field 22 of the whole line.
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+        age = uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.monotonic() - max(age, 0.0)
+    except (OSError, ValueError, IndexError):
+        return IMPORTED
+
+# Log the cold start (process start to first HTTP request) and warn when it is
+# over STARTUP_BUDGET_MS.
+def report_startup(started: float, first_request: Optional[float], budget_ms: float = DEFAULT_STARTUP_BUDGET_MS):
+    if first_request is None:
+        return
+    elapsed_ms = (first_request - started) * 1000
+    if budget_ms and elapsed_ms > budget_ms:
+        logging.warning(f"Startup: first request after {elapsed_ms:.0f} ms, over the {budget_ms:.0f} ms budget")
+    else:
+        logging.info(f"Startup: first request after {elapsed_ms:.0f} ms")
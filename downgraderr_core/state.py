@@ -0,0 +1,62 @@
+import hashlib
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable
+
+from downgraderr_core.cache import MetadataCache
+
+# Config keys profile decisions depend on: CONDITIONS, *_THRESHOLD_*, PROFILE_*_GENRES,
+# PROFILE_*_NAME and PROFILE_SIZE_RATIOS. Connection, rate limit, cache and report
+# settings are left out, so tuning them does not force a full re-evaluation.
+DECISION_KEYS = re.compile(r"CONDITIONS|PROFILE_SIZE_RATIOS|.*_THRESHOLD(_.*)?|PROFILE_.*_(GENRES|NAME)")
+
+# Version of the decision config: any change to it forces every item to be re-evaluated.
+def config_version(config: Dict[str, Any]) -> str:
+    decisive = {key: value for key, value in config.items() if DECISION_KEYS.fullmatch(key)}
+    return hashlib.blake2b(json.dumps(decisive, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+# Fingerprint of everything a profile decision depended on, per item, as of the
+# last run. Lives in the metadata cache database next to the ratings.
+class StateStore:
+    def __init__(self, cache: MetadataCache, app: str, version: str):
+        self.cache = cache
+        self.app = app
+        self.version = version
+        self.cache.db.executescript('''CREATE TABLE IF NOT EXISTS item_state
+                                       (app TEXT NOT NULL, item_id INTEGER NOT NULL, fingerprint TEXT, timestamp TEXT,
+                                        PRIMARY KEY (app, item_id)) WITHOUT ROWID''')
+        # One query up front instead of one per item; afterwards this dict is the
+        # only thing read, and writes go to the database thread without waiting.
+        self.fingerprints = dict(self.cache.db.query("SELECT item_id, fingerprint FROM item_state WHERE app = ?", (app,)))
+        self.skipped = 0
+        self.evaluated = 0
+        # Dry runs compare against the stored fingerprints but never update them.
+        self.read_only = False
+
+    def fingerprint(self, *inputs: Any) -> str:
+        return hashlib.blake2b(repr((self.version, inputs)).encode(), digest_size=16).hexdigest()
+
+    def unchanged(self, item_id: int, fingerprint: str) -> bool:
+        if self.fingerprints.get(item_id) == fingerprint:
+            self.skipped += 1
+            return True
+        return False
+
+    def record(self, item_id: int, fingerprint: str):
+        self.evaluated += 1
+        if self.read_only or self.fingerprints.get(item_id) == fingerprint:
+            return
+        self.fingerprints[item_id] = fingerprint
+        self.cache.db.execute("INSERT OR REPLACE INTO item_state (app, item_id, fingerprint, timestamp) VALUES (?, ?, ?, ?)",
+                              (self.app, item_id, fingerprint, datetime.now().isoformat()))
+
+    def forget(self, item_ids: Iterable[int]):
+        if self.read_only:
+            return
+        forgotten = [(self.app, item_id) for item_id in item_ids if self.fingerprints.pop(item_id, None) is not None]
+        self.cache.db.executemany("DELETE FROM item_state WHERE app = ? AND item_id = ?", forgotten)
+
+    def report(self):
+        logging.info(f"Incremental run: {self.evaluated} items evaluated, {self.skipped} unchanged since the last run skipped")
@@ -0,0 +1,60 @@
+import logging
+from array import array
+from typing import Dict, List
+
+from downgraderr_core.records import ItemRecord
+
+GIB = 1024 ** 3
+
+# Column-oriented summary of a library listing (id, profile, episode and file
+# counts, size on disk, last airing / release year, status), filled in the same
+# pass that streams the listing. Typed arrays take a few dozen bytes per item,
+# so library-wide totals and rankings stay cheap on libraries of any size.
+class LibraryTable:
+    def __init__(self):
+        self.ids = array('q')
+        self.profiles = array('q')
+        self.episodes = array('l')
+        self.files = array('l')
+        self.sizes = array('q')
+        self.years = array('h')
+        self.statuses = array('B')
+        self.status_names: List[str] = []
+        self._status_codes: Dict[str, int] = {}
+
+    def append(self, record: ItemRecord):
+        status = self._status_codes.get(record.status)
+        if status is None:
+            status = self._status_codes[record.status] = len(self.status_names)
+            self.status_names.append(record.status)
+        self.ids.append(record.id)
+        self.profiles.append(record.profile_id)
+        self.episodes.append(record.episodes)
+        self.files.append(record.files)
+        self.sizes.append(record.size_on_disk)
+        self.years.append(record.year)
+        self.statuses.append(status)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # Bytes on disk per quality profile id.
+    def size_by_profile(self) -> Dict[int, int]:
+        totals: Dict[int, int] = {}
+        for profile_id, size in zip(self.profiles, self.sizes):
+            totals[profile_id] = totals.get(profile_id, 0) + size
+        return totals
+
+    # Item counts per status.
+    def status_counts(self) -> Dict[str, int]:
+        counts = [0] * len(self.status_names)
+        for status in self.statuses:
+            counts[status] += 1
+        return dict(zip(self.status_names, counts))
+
+    def report(self, kind: str):
+        by_profile = ", ".join(f"profile {profile_id}: {size / GIB:.1f} GiB"
+                               for profile_id, size in sorted(self.size_by_profile().items()))
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(self.status_counts().items()))
+        logging.info(f"{kind} library: {len(self)} items, {sum(self.files)} files, {sum(self.sizes) / GIB:.1f} GiB on disk "
+                     f"({by_profile or 'empty'}); by status ({statuses or 'none'})")
@@ -0,0 +1,195 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from downgraderr_core.cache import NOT_FOUND, MetadataCache
+from downgraderr_core.records import ItemRecord
+
+# Background refreshes per second during a run (REFRESH_RATE); they also count
+# against the TMDB rate limit.
+DEFAULT_REFRESH_RATE = 4
+
+# TMDB requests in flight, by cache and what they look up. Instances sharing a cache
+# (a multi-instance run) that need the same title at the same time wait for one
+# request instead of sending one each.
+_in_flight: Dict[Tuple, "asyncio.Future"] = {}
+
+async def single_flight(cache: MetadataCache, key: Tuple, request: Callable[[], Awaitable[Any]]) -> Any:
+    key = (id(cache),) + key
+    pending = _in_flight.get(key)
+    if pending is not None:
+        cache.stats["tmdb_shared"] += 1
+    else:
+        pending = _in_flight[key] = asyncio.ensure_future(request())
+        pending.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # Shielded: one waiter being cancelled must not cancel the request for the others
+    return await asyncio.shield(pending)
+
+# Keys an item can be looked up by, most stable first.
+def lookup_keys(media_type: str, item: ItemRecord, title: str, year: Optional[int]) -> List[Tuple[str, str]]:
+    keys = []
+    if media_type == "tv" and item.tvdb_id:
+        keys.append(("tvdb", str(item.tvdb_id)))
+    if item.imdb_id:
+        keys.append(("imdb", str(item.imdb_id)))
+    keys.append(("title", f"{title.lower()}|{year or ''}"))
+    return keys
+
+# Resolve the TMDB id of a Sonarr series ("tv") or Radarr movie ("movie").
+# Order: the id carried by the item, the persisted mapping, TMDB /find on the
+# external ids, and only then a title search. Whatever is found gets persisted.
+async def resolve_tmdb_id(session, fetch, cache: MetadataCache, media_type: str, item: ItemRecord,
+                          title: str, year: Optional[int], api_url: str, api_key: str) -> int:
+    if item.tmdb_id:
+        cache.stats["id_direct"] += 1
+        return item.tmdb_id
+
+    keys = lookup_keys(media_type, item, title, year)
+    tmdb_id = await cache.get_tmdb_id(media_type, keys)
+    if tmdb_id is not None:
+        cache.stats["id_cached"] += 1
+        return tmdb_id
+    return await single_flight(cache, ("id", media_type, keys[0]),
+                               lambda: lookup_tmdb_id(session, fetch, cache, media_type, keys, title, year, api_url, api_key))
+
+# Find the TMDB id of an item the cache does not know, and persist it.
+async def lookup_tmdb_id(session, fetch, cache: MetadataCache, media_type: str, keys: List[Tuple[str, str]],
+                         title: str, year: Optional[int], api_url: str, api_key: str) -> int:
+    for source, external_id in keys:
+        if source == "title":
+            continue
+        data = await fetch(session, f"{api_url}/find/{external_id}",
+                           params={"api_key": api_key, "external_source": f"{source}_id"})
+        results = data.get(f"{media_type}_results", [])
+        if results:
+            cache.stats["id_find"] += 1
+            cache.put_tmdb_id(media_type, keys[0][0], keys[0][1], results[0]["id"])
+            return results[0]["id"]
+
+    params = {"api_key": api_key, "query": title}
+    if year:
+        params["first_air_date_year" if media_type == "tv" else "year"] = year
+    data = await fetch(session, f"{api_url}/search/{media_type}", params=params)
+    if data["total_results"] == 0:
+        logging.warning(f"No results found for '{title}' on TMDb.")
+        cache.stats["id_not_found"] += 1
+        tmdb_id = NOT_FOUND
+    else:
+        cache.stats["id_search"] += 1
+        tmdb_id = data["results"][0]["id"]
+    cache.put_tmdb_id(media_type, keys[0][0], keys[0][1], tmdb_id)
+    return tmdb_id
+
+# Fetch one rating from TMDB and store it.
+async def fetch_rating(session, fetch, cache: MetadataCache, media_type: str, tmdb_id: int,
+                       api_url: str, api_key: str) -> float:
+    async def request():
+        data = await fetch(session, f"{api_url}/{media_type}/{tmdb_id}", params={"api_key": api_key})
+        rating = data["vote_average"]
+        cache.put_rating(media_type, tmdb_id, rating)
+        return rating
+    return await single_flight(cache, ("rating", media_type, tmdb_id), request)
+
+# Stale-while-revalidate: an expired rating is still used for the decision, and
+# refetched here in the background at a low rate. Whatever is still queued when
+# the run ends stays expired in the cache for the next run or `warm-cache`.
+class RatingRefresher:
+    def __init__(self, session, fetch, cache: MetadataCache, api_url: str, api_key: str,
+                 rate: float = DEFAULT_REFRESH_RATE):
+        self.session = session
+        self.fetch = fetch
+        self.cache = cache
+        self.api_url = api_url
+        self.api_key = api_key
+        self.interval = 1 / rate if rate > 0 else 0
+        self.queue = asyncio.Queue()
+        self.queued = set()
+        # (media_type, tmdb_id) being fetched right now
+        self.current: Optional[Tuple[str, int]] = None
+        self.task: Optional["asyncio.Task"] = None
+        self.refreshed = 0
+        self.failed = 0
+
+    def add(self, media_type: str, tmdb_id: int):
+        if (media_type, tmdb_id) not in self.queued:
+            self.queued.add((media_type, tmdb_id))
+            self.queue.put_nowait((media_type, tmdb_id))
+
+    async def run(self):
+        while True:
+            media_type, tmdb_id = await self.queue.get()
+            started = time.monotonic()
+            self.current = (media_type, tmdb_id)
+            try:
+                await fetch_rating(self.session, self.fetch, self.cache, media_type, tmdb_id, self.api_url, self.api_key)
+                self.refreshed += 1
+            except Exception as e:
+                self.failed += 1
+                logging.warning(f"Could not refresh rating for TMDB ID '{tmdb_id}' ({e})")
+            finally:
+                self.current = None
+                self.queued.discard((media_type, tmdb_id))
+            await asyncio.sleep(max(self.interval - (time.monotonic() - started), 0))
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    # Cancel run() and wait for it, and for the request it had in flight: that one
+    # is shielded (single_flight), so it would otherwise outlive the cancellation
+    # and still be using the session after it is closed.
+    async def stop(self):
+        if self.task is None:
+            return
+        pending = _in_flight.get((id(self.cache), "rating") + self.current) if self.current else None
+        self.task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.task
+        self.task = None
+        if pending is not None:
+            with contextlib.suppress(Exception):
+                await pending
+
+    def report(self):
+        logging.info(f"Rating refresh: {self.refreshed} refreshed in the background, {self.failed} failed, "
+                     f"{self.queue.qsize()} left for the next run")
+
+# The rating the cache holds for an item, whatever its age, without any request.
+# None means the item has never been rated (or its TMDB id is not known yet).
+# An expired rating is handed to `refresher`, if given, to be refetched.
+async def cached_rating(cache: MetadataCache, media_type: str, item: ItemRecord, title: str, year: Optional[int],
+                  refresher: Optional[RatingRefresher] = None) -> Optional[float]:
+    tmdb_id = item.tmdb_id or await cache.get_tmdb_id(media_type, lookup_keys(media_type, item, title, year))
+    if tmdb_id is None:
+        return None
+    if tmdb_id == NOT_FOUND:
+        return 0
+    if refresher is not None and await cache.rating_is_stale(media_type, tmdb_id):
+        refresher.add(media_type, tmdb_id)
+    return await cache.peek_rating(media_type, tmdb_id)
+
+# Fetch the TMDB rating for an item, using the cached rating if it is recent. With
+# a refresher, an expired rating is returned as-is and refetched in the background.
+async def get_rating(session, fetch, cache: MetadataCache, media_type: str, item: ItemRecord,
+                     title: str, year: Optional[int], api_url: str, api_key: str,
+                     refresher: Optional[RatingRefresher] = None) -> float:
+    tmdb_id = await resolve_tmdb_id(session, fetch, cache, media_type, item, title, year, api_url, api_key)
+    if tmdb_id == NOT_FOUND:
+        return 0
+
+    rating = await cache.get_rating(media_type, tmdb_id)
+    if rating is not None:
+        logging.debug("Using cached rating for TMDB ID '%s'", tmdb_id)
+        return rating
+
+    if refresher is not None:
+        rating = await cache.peek_rating(media_type, tmdb_id)
+        if rating is not None:
+            # Another instance sharing the cache may have just fetched it: only an expired one is refreshed
+            if await cache.rating_is_stale(media_type, tmdb_id):
+                cache.stats["rating_stale"] += 1
+                refresher.add(media_type, tmdb_id)
+            return rating
+
+    return await fetch_rating(session, fetch, cache, media_type, tmdb_id, api_url, api_key)
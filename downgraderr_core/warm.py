@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import timedelta
+from typing import List, Optional
+
+from downgraderr_core.cache import MetadataCache
+from downgraderr_core.scheduler import Scheduler
+from downgraderr_core.tmdb import fetch_rating
+
+DEFAULT_WARM_WINDOW_HOURS = 24
+DEFAULT_WARM_RATE = 1
+
+# Refetch every rating that has expired or expires within `within`, soonest first,
+# at most `rate` per second, so regular runs find them fresh.
+async def warm(cache: MetadataCache, scheduler: Scheduler, api_url: str, api_key: str, within: timedelta,
+               rate: float = DEFAULT_WARM_RATE, limit: Optional[int] = None) -> int:
+    expiring = (await cache.expiring_ratings(within))[:limit]
+    if not expiring:
+        logging.info(f"Cache warmer: no ratings expire within {within}")
+        return 0
+    logging.info(f"Cache warmer: refreshing {len(expiring)} ratings expiring within {within}")
+
+    async def fetch(session, url, params=None, headers=None):
+        return await scheduler.request(session, "GET", url, params=params, headers=headers)
+
+    interval = 1 / rate if rate > 0 else 0
+    refreshed = failed = 0
+    async with scheduler.session() as session:
+        for media_type, tmdb_id, expires in expiring:
+            started = time.monotonic()
+            try:
+                await fetch_rating(session, fetch, cache, media_type, tmdb_id, api_url, api_key)
+                refreshed += 1
+            except Exception as e:
+                failed += 1
+                logging.warning(f"Could not refresh rating for TMDB ID '{tmdb_id}' ({e})")
+            await asyncio.sleep(max(interval - (time.monotonic() - started), 0))
+    cache.commit()
+    logging.info(f"Cache warmer: {refreshed} ratings refreshed, {failed} failed")
+    return refreshed
+
+# Command line entry point: `python -m downgraderr_core warm-cache`. Works with
+# either script's config; both share the cache in CACHE_DIR.
+def run(argv: Optional[List[str]] = None, prog: Optional[str] = None):
+    parser = argparse.ArgumentParser(prog=prog, description="Refresh TMDB ratings that are about to expire.")
+    parser.add_argument('--config', metavar='FILE', default='config.json', help="Sonarr or Radarr config file (default: config.json)")
+    parser.add_argument('--within', metavar='HOURS', type=float, help="refresh ratings expiring within HOURS (default: WARM_CACHE_WINDOW_HOURS or 24)")
+    parser.add_argument('--rate', type=float, help="requests per second (default: WARM_CACHE_RATE or 1)")
+    parser.add_argument('--limit', type=int, help="refresh at most this many ratings")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    with open(args.config, 'r') as file:
+        config = json.load(file)
+    tmdb_api_url = config.get('TMDB_API_URL', "https://api.themoviedb.org/3")
+    within = args.within if args.within is not None else config.get('WARM_CACHE_WINDOW_HOURS', DEFAULT_WARM_WINDOW_HOURS)
+    rate = args.rate if args.rate is not None else config.get('WARM_CACHE_RATE', DEFAULT_WARM_RATE)
+
+    scheduler = Scheduler.from_config(config, {tmdb_api_url: "tmdb"})
+    cache = MetadataCache.from_config(config)
+    try:
+        asyncio.run(warm(cache, scheduler, tmdb_api_url, config.get('TMDB_API_KEY'), timedelta(hours=within), rate, args.limit))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cache.close()
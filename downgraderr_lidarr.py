@@ -0,0 +1,59 @@
+from typing import List, Dict, Any, Optional
+
+from downgraderr_core.records import ItemRecord
+from downgraderr_core.script import ArrScript
+
+# Get the release date of the artist's latest album, if Lidarr knows it.
+def get_last_release(artist: Dict[str, Any]) -> Optional[str]:
+    return (artist.get('lastAlbum') or {}).get('releaseDate')
+
+# Get the release year of the artist's latest album.
+def get_year_of_last_release(artist: Dict[str, Any]) -> int:
+    release_date = get_last_release(artist)
+    if release_date and release_date[:4].isdigit():
+        return int(release_date[:4])
+    return 0
+
+# Get the rating Lidarr's metadata gives the artist, on the same 0-10 scale as TMDB.
+def get_rating(artist: Dict[str, Any]) -> float:
+    return (artist.get('ratings') or {}).get('value', 0)
+
+# Build the compact record for an artist from its /artist listing entry. Tracks
+# stand in for episodes (EPISODE_THRESHOLD_*), the latest album for the last airing.
+def artist_record(artist: Dict[str, Any]) -> ItemRecord:
+    statistics = artist.get('statistics', {})
+    return ItemRecord(artist['id'], artist['artistName'], artist.get('status', ''), artist.get('genres', []),
+                      artist['qualityProfileId'], episodes=statistics.get('totalTrackCount', 0),
+                      year=get_year_of_last_release(artist), aired=get_last_release(artist), rating=get_rating(artist),
+                      files=statistics.get('trackFileCount', 0), size_on_disk=statistics.get('sizeOnDisk', 0))
+
+# Lidarr: artists decided by CONDITIONS. The three profile tiers keep the Sonarr
+# names ("4k" best, "720p" smallest); for music they are e.g. Lossless, High and
+# Standard. TMDB has no music, so the rating is Lidarr's own, from the listing.
+class LidarrScript(ArrScript):
+    app = "lidarr"
+    title = "Lidarr"
+    kind = "artist"
+    ids_field = "artistIds"
+    noun = "artist"
+    plural = "artists"
+    url_key = "LIDARR_IP"
+    default_config = "config_lidarr.json"
+    record_fields = ('id', 'artistName', 'status', 'genres', 'qualityProfileId', 'ratings', 'statistics', 'lastAlbum')
+
+    def record(self, item: Dict[str, Any]) -> ItemRecord:
+        return artist_record(item)
+
+    # The rating comes with the listing, so nothing is fetched
+    async def rating(self, session, item: ItemRecord) -> float:
+        return item.rating
+
+    async def known_rating(self, item: ItemRecord) -> Optional[float]:
+        return item.rating
+
+# Command line entry point, also used by `python -m downgraderr_core lidarr`.
+def run(argv: Optional[List[str]] = None, prog: Optional[str] = None):
+    LidarrScript().run(argv, prog)
+
+if __name__ == "__main__":
+    run()